@@ -65,7 +65,7 @@ app.use(cors({
   },
   credentials: true,
   // Expose headers needed for file downloads
-  exposedHeaders: ['Content-Disposition']
+  exposedHeaders: ['Content-Disposition', 'X-Vegetation-Coverage']
 }));
 app.use(express.json({ limit: '50mb' })); // Increase limit for base64 image data
 app.use(express.urlencoded({ limit: '50mb', extended: true }));
@@ -210,6 +210,54 @@ app.get('/api/tiles', (req, res) => {
   }
 });
 
+// Detection form fields forwarded to Python (/detect-trees and /jobs/detect-trees)
+function buildDetectionFormData(req) {
+  const formData = new FormData();
+
+  // Add image file
+  if (req.file) {
+    formData.append('image', req.file.buffer, {
+      filename: req.file.originalname || 'image.png',
+      contentType: req.file.mimetype
+    });
+  }
+
+  // Add all detection parameters
+  formData.append('hue_min', req.body.hue_min);
+  formData.append('hue_max', req.body.hue_max);
+  formData.append('sat_min', req.body.sat_min);
+  formData.append('sat_max', req.body.sat_max);
+  formData.append('val_min', req.body.val_min);
+  formData.append('val_max', req.body.val_max);
+  formData.append('min_diameter', req.body.min_diameter);
+  formData.append('max_diameter', req.body.max_diameter);
+  formData.append('cluster_threshold', req.body.cluster_threshold);
+  formData.append('real_width', req.body.real_width);
+  formData.append('real_height', req.body.real_height);
+
+  // Optional tuning parameters (only forwarded when the client sets them)
+  const optionalParams = ['tile_size', 'tile_overlap', 'tile_workers', 'extraction', 'population', 'seed', 'population_workers', 'session_id',
+    'additional_hsv_ranges', 'threshold_engine', 'lut_bits', 'include_polygons', 'response_format',
+    'simplify_tolerance_m', 'cleanup_kernel', 'cleanup_iterations', 'cleanup_median', 'pyramid', 'pyramid_factor',
+    'target_meters_per_pixel', 'stream', 'band_rows'];
+  for (const param of optionalParams) {
+    if (req.body[param] !== undefined && req.body[param] !== '') {
+      formData.append(param, req.body[param]);
+    }
+  }
+  return formData;
+}
+
+// Error bodies of arraybuffer requests (FastAPI errors are JSON)
+function parseJsonBuffer(data) {
+  const text = Buffer.from(data).toString('utf8');
+  try {
+    return JSON.parse(text);
+  } catch {
+    return { detail: text };
+  }
+}
+
 // Phase 3 - Tree detection endpoint (proxy to Python)
 app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
   try {
@@ -229,46 +277,29 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
       image_size: req.file?.size
     });
 
-    // Validate image upload
-    if (!req.file) {
+    // Validate image upload (or a previously created image session)
+    if (!req.file && !req.body.session_id) {
       return res.status(400).json({
         error: 'No image uploaded',
-        message: 'Please upload an image file'
+        message: 'Please upload an image file or pass a session_id'
       });
     }
 
     // Create FormData to forward to Python
-    const formData = new FormData();
-
-    // Add image file
-    formData.append('image', req.file.buffer, {
-      filename: req.file.originalname || 'image.png',
-      contentType: req.file.mimetype
-    });
-
-    // Add all detection parameters
-    formData.append('hue_min', req.body.hue_min);
-    formData.append('hue_max', req.body.hue_max);
-    formData.append('sat_min', req.body.sat_min);
-    formData.append('sat_max', req.body.sat_max);
-    formData.append('val_min', req.body.val_min);
-    formData.append('val_max', req.body.val_max);
-    formData.append('min_diameter', req.body.min_diameter);
-    formData.append('max_diameter', req.body.max_diameter);
-    formData.append('cluster_threshold', req.body.cluster_threshold);
-    formData.append('real_width', req.body.real_width);
-    formData.append('real_height', req.body.real_height);
+    const formData = buildDetectionFormData(req);
 
     console.log('Forwarding request to Python backend...');
 
-    // Forward to Python FastAPI
+    // Forward to Python FastAPI; the Accept header picks JSON or a columnar binary format
     const pythonResponse = await axios.post(
       `${PYTHON_API_URL}/detect-trees`,
       formData,
       {
         headers: {
-          ...formData.getHeaders()
+          ...formData.getHeaders(),
+          ...(req.headers.accept ? { accept: req.headers.accept } : {})
         },
+        responseType: 'arraybuffer',  // Passed through as is, without re-serializing
         maxBodyLength: Infinity,
         maxContentLength: Infinity,
         timeout: 600000 // 10 minutes timeout for large tiles (4951m × 4886m needs ~65s)
@@ -276,18 +307,25 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
     );
 
     console.log('✅ Python detection successful:', {
-      individualTrees: pythonResponse.data.summary?.individualTreesCount,
-      clusters: pythonResponse.data.summary?.treeClustersCount,
-      totalPopulated: pythonResponse.data.summary?.totalPopulatedTrees
+      resultId: pythonResponse.headers['x-result-id'],
+      contentType: pythonResponse.headers['content-type'],
+      bytes: pythonResponse.data.byteLength,
+      cache: pythonResponse.headers['x-cache']
     });
 
     // Return Python's response to frontend
-    res.json(pythonResponse.data);
+    for (const header of ['content-type', 'x-result-id', 'x-cache', 'vary']) {
+      if (pythonResponse.headers[header]) {
+        res.set(header, pythonResponse.headers[header]);
+      }
+    }
+    res.send(Buffer.from(pythonResponse.data));
 
   } catch (error) {
     console.error('❌ Error in tree detection:', error.message);
 
     if (error.response) {
+      error.response.data = parseJsonBuffer(error.response.data);
       // Python returned an error
       console.error('Python error response:', error.response.data);
       res.status(error.response.status).json({
@@ -312,63 +350,239 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
   }
 });
 
-// Phase 3.4 - 3D model generation endpoint (OBJ file download)
+// Image sessions - upload a tile once, then detect/threshold by session_id (proxy to Python)
+app.post('/api/image-sessions', upload.single('image'), async (req, res) => {
+  try {
+    if (!req.file) {
+      return res.status(400).json({
+        error: 'No image uploaded',
+        message: 'Please upload an image file'
+      });
+    }
+
+    const formData = new FormData();
+    formData.append('image', req.file.buffer, {
+      filename: req.file.originalname || 'image.png',
+      contentType: req.file.mimetype
+    });
+
+    const pythonResponse = await axios.post(`${PYTHON_API_URL}/image-sessions`, formData, {
+      headers: { ...formData.getHeaders() },
+      maxBodyLength: Infinity,
+      maxContentLength: Infinity,
+      timeout: 120000
+    });
+
+    res.json(pythonResponse.data);
+  } catch (error) {
+    console.error('❌ Error creating image session:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'Image session creation failed',
+      message: error.response?.data?.detail || error.message
+    });
+  }
+});
+
+app.post('/api/image-sessions/:sessionId/threshold', upload.none(), async (req, res) => {
+  try {
+    const formData = new FormData();
+    for (const param of ['hue_min', 'hue_max', 'sat_min', 'sat_max', 'val_min', 'val_max']) {
+      formData.append(param, req.body[param]);
+    }
+    if (req.body.additional_hsv_ranges !== undefined && req.body.additional_hsv_ranges !== '') {
+      formData.append('additional_hsv_ranges', req.body.additional_hsv_ranges);
+    }
+
+    const pythonResponse = await axios.post(
+      `${PYTHON_API_URL}/image-sessions/${encodeURIComponent(req.params.sessionId)}/threshold`,
+      formData,
+      {
+        headers: { ...formData.getHeaders() },
+        responseType: 'arraybuffer',
+        timeout: 60000
+      }
+    );
+
+    res.set({
+      'Content-Type': 'image/png',
+      'X-Vegetation-Coverage': pythonResponse.headers['x-vegetation-coverage']
+    });
+    res.send(Buffer.from(pythonResponse.data));
+  } catch (error) {
+    console.error('❌ Error thresholding image session:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'Thresholding failed',
+      message: error.message
+    });
+  }
+});
+
+app.delete('/api/image-sessions/:sessionId', async (req, res) => {
+  try {
+    const pythonResponse = await axios.delete(
+      `${PYTHON_API_URL}/image-sessions/${encodeURIComponent(req.params.sessionId)}`
+    );
+    res.json(pythonResponse.data);
+  } catch (error) {
+    res.status(error.response?.status || 500).json({
+      error: 'Image session deletion failed',
+      message: error.response?.data?.detail || error.message
+    });
+  }
+});
+
+// HSV histogram sweeps - build once per image, then query coverage of candidate ranges (proxy to Python)
+app.post('/api/hsv-histogram', upload.single('image'), async (req, res) => {
+  try {
+    const formData = new FormData();
+    if (req.file) {
+      formData.append('image', req.file.buffer, {
+        filename: req.file.originalname || 'image.png',
+        contentType: req.file.mimetype
+      });
+    } else if (!req.body.session_id) {
+      return res.status(400).json({
+        error: 'No image uploaded',
+        message: 'Please upload an image file or provide a session_id'
+      });
+    }
+    for (const param of ['session_id', 'ranges']) {
+      if (req.body[param] !== undefined && req.body[param] !== '') {
+        formData.append(param, req.body[param]);
+      }
+    }
+
+    const pythonResponse = await axios.post(`${PYTHON_API_URL}/hsv-histogram`, formData, {
+      headers: { ...formData.getHeaders() },
+      maxBodyLength: Infinity,
+      maxContentLength: Infinity,
+      timeout: 120000
+    });
+
+    res.json(pythonResponse.data);
+  } catch (error) {
+    console.error('❌ Error building HSV histogram:', error.message);
+    res.status(error.response?.status || 500).json({
+      error: 'HSV histogram failed',
+      message: error.response?.data?.detail || error.message
+    });
+  }
+});
+
+app.post('/api/hsv-histogram/:histogramId/coverage', async (req, res) => {
+  try {
+    const pythonResponse = await axios.post(
+      `${PYTHON_API_URL}/hsv-histogram/${encodeURIComponent(req.params.histogramId)}/coverage`,
+      req.body,
+      { timeout: 30000 }
+    );
+    res.json(pythonResponse.data);
+  } catch (error) {
+    res.status(error.response?.status || 500).json({
+      error: 'HSV coverage query failed',
+      message: error.response?.data?.detail || error.message
+    });
+  }
+});
+
+// Collect a (small) JSON body from a response stream, e.g. a FastAPI error
+async function readJsonStream(stream) {
+  const chunks = [];
+  for await (const chunk of stream) {
+    chunks.push(chunk);
+  }
+  const text = Buffer.concat(chunks).toString('utf8');
+  try {
+    return JSON.parse(text);
+  } catch {
+    return { detail: text };
+  }
+}
+
+// Model generation options forwarded to Python (base model, obj/glb format,
+// GLB instancing, OBJ index mode, level of detail and its budgets, spatial cells),
+// and the stored detection result to use instead of the body, with its tree filters
+const MODEL_QUERY_PARAMS = [
+  'model', 'format', 'instancing', 'relative_indices',
+  'lod', 'vertex_budget', 'max_file_mb', 'small_tree_diameter',
+  'cell_size_m', 'cell',
+  'result_id', 'min_tree_diameter', 'max_tree_diameter', 'tree_types'
+];
+
+function modelQueryParams(req) {
+  const params = {};
+  for (const name of MODEL_QUERY_PARAMS) {
+    if (req.query[name] !== undefined) {
+      params[name] = req.query[name];
+    }
+  }
+  return params;
+}
+
+// Phase 3.4 - 3D model generation endpoint (streamed OBJ, or instanced GLB with ?format=glb)
 app.post('/api/generate-model', async (req, res) => {
   try {
     console.log('🏗️ Generating 3D model from tree detection data...');
 
-    // Validate detection data
-    if (!req.body) {
+    // Validate detection data (or a result stored by the Python backend)
+    if (!req.query.result_id && (!req.body || !Object.keys(req.body).length)) {
       return res.status(400).json({
         error: 'No detection data provided',
-        message: 'Please provide tree detection results'
+        message: 'Please provide tree detection results or a result_id'
       });
     }
 
-    console.log('Detection data:', {
+    console.log('Detection data:', req.query.result_id ? { resultId: req.query.result_id } : {
       individualTrees: req.body.individualTrees?.length || 0,
       clusters: req.body.treeClusters?.length || 0,
       totalPopulated: req.body.summary?.totalPopulatedTrees || 0
     });
 
-    // Forward detection JSON to Python
+    // Forward detection JSON (empty with result_id) to Python; the OBJ comes back as a chunked stream
     const pythonResponse = await axios.post(
       `${PYTHON_API_URL}/generate-model`,
-      req.body,  // Send complete detection JSON
+      req.body || {},
       {
+        params: { ...modelQueryParams(req), gzip: req.query.gzip },
+        responseType: 'stream',
+        decompress: false,  // Pass gzip through to the browser untouched
         timeout: 300000,  // 5 minutes timeout for large models
         maxBodyLength: Infinity,
         maxContentLength: Infinity
       }
     );
 
-    console.log('✅ Model generated successfully');
-
-    // For very large models (>20k trees), Python saves to Downloads and returns JSON
-    if (pythonResponse.data.filepath) {
-      console.log('Large model saved to Downloads:', pythonResponse.data);
+    console.log('✅ Model generation started:', {
+      trees: pythonResponse.headers['x-tree-count'],
+      vertices: pythonResponse.headers['x-vertex-count']
+    });
 
-      // Return JSON response (model already in Downloads folder)
-      res.json(pythonResponse.data);
-    } else {
-      // Small/medium models - return OBJ content directly
-      res.set({
-        'Content-Type': 'model/obj',
-        'Content-Disposition': 'attachment; filename=trees_model.obj'
-      });
-      res.send(pythonResponse.data);
+    const forwardedHeaders = [
+      'content-type', 'content-disposition', 'content-encoding',
+      'x-tree-count', 'x-vertex-count', 'x-face-count', 'x-model-lod', 'x-cell-count'
+    ];
+    for (const header of forwardedHeaders) {
+      if (pythonResponse.headers[header]) {
+        res.set(header, pythonResponse.headers[header]);
+      }
     }
+    pythonResponse.data.on('error', (streamError) => {
+      console.error('❌ Model stream error:', streamError.message);
+      res.destroy(streamError);
+    });
+    pythonResponse.data.pipe(res);
 
   } catch (error) {
     console.error('❌ Model generation error:', error.message);
 
     if (error.response && error.response.data) {
-      // Python returned an error
-      console.error('Python error response:', error.response.data);
+      // Python returned an error (as a stream, since responseType is 'stream')
+      const pythonError = await readJsonStream(error.response.data);
+      console.error('Python error response:', pythonError);
       res.status(error.response.status).json({
         error: 'Model generation failed',
-        message: error.response.data.detail || error.response.data.error || error.message,
-        pythonError: error.response.data
+        message: pythonError.detail || pythonError.error || error.message,
+        pythonError
       });
     } else if (error.code === 'ECONNREFUSED') {
       // Python backend not running
@@ -387,6 +601,116 @@ app.post('/api/generate-model', async (req, res) => {
   }
 });
 
+// Base tree models available for model generation (proxy to Python)
+app.get('/api/tree-models', async (req, res) => {
+  try {
+    const pythonResponse = await axios.get(`${PYTHON_API_URL}/tree-models`);
+    res.json(pythonResponse.data);
+  } catch (error) {
+    res.status(error.response?.status || 500).json({
+      error: 'Tree model listing failed',
+      message: error.response?.data?.detail || error.message
+    });
+  }
+});
+
+// Background jobs - submit detection/model generation, then poll for the result (proxy to Python)
+function sendJobError(res, error, fallbackMessage) {
+  res.status(error.response?.status || 500).json({
+    error: fallbackMessage,
+    message: error.response?.data?.detail || error.message
+  });
+}
+
+app.post('/api/jobs/detect-trees', upload.single('image'), async (req, res) => {
+  try {
+    if (!req.file && !req.body.session_id) {
+      return res.status(400).json({
+        error: 'No image uploaded',
+        message: 'Please upload an image file or pass a session_id'
+      });
+    }
+
+    const formData = buildDetectionFormData(req);
+    // The Accept header picks the result format, as for /api/detect-trees
+    const pythonResponse = await axios.post(`${PYTHON_API_URL}/jobs/detect-trees`, formData, {
+      headers: {
+        ...formData.getHeaders(),
+        ...(req.headers.accept ? { accept: req.headers.accept } : {})
+      },
+      maxBodyLength: Infinity,
+      maxContentLength: Infinity,
+      timeout: 120000
+    });
+    res.status(pythonResponse.status).json(pythonResponse.data);
+  } catch (error) {
+    console.error('❌ Error submitting detection job:', error.message);
+    sendJobError(res, error, 'Detection job submission failed');
+  }
+});
+
+app.post('/api/jobs/generate-model', async (req, res) => {
+  try {
+    const pythonResponse = await axios.post(`${PYTHON_API_URL}/jobs/generate-model`, req.body, {
+      params: modelQueryParams(req),
+      maxBodyLength: Infinity,
+      maxContentLength: Infinity,
+      timeout: 120000
+    });
+    res.status(pythonResponse.status).json(pythonResponse.data);
+  } catch (error) {
+    console.error('❌ Error submitting model job:', error.message);
+    sendJobError(res, error, 'Model job submission failed');
+  }
+});
+
+app.get('/api/jobs/:jobId', async (req, res) => {
+  try {
+    const pythonResponse = await axios.get(`${PYTHON_API_URL}/jobs/${encodeURIComponent(req.params.jobId)}`);
+    res.json(pythonResponse.data);
+  } catch (error) {
+    sendJobError(res, error, 'Job lookup failed');
+  }
+});
+
+app.get('/api/jobs/:jobId/result', async (req, res) => {
+  try {
+    const pythonResponse = await axios.get(
+      `${PYTHON_API_URL}/jobs/${encodeURIComponent(req.params.jobId)}/result`,
+      { responseType: 'arraybuffer', maxContentLength: Infinity, timeout: 300000 }
+    );
+    const forwardedHeaders = [
+      'content-type', 'content-disposition', 'x-cache', 'x-result-id', 'vary', 'x-model-lod'
+    ];
+    for (const header of forwardedHeaders) {
+      if (pythonResponse.headers[header]) {
+        res.set(header, pythonResponse.headers[header]);
+      }
+    }
+    res.status(pythonResponse.status).send(Buffer.from(pythonResponse.data));
+  } catch (error) {
+    let detail;
+    try {
+      detail = JSON.parse(Buffer.from(error.response.data).toString()).detail;
+    } catch (parseError) {
+      detail = undefined;
+    }
+    res.status(error.response?.status || 500).json({
+      error: 'Job result unavailable',
+      message: detail || error.message
+    });
+  }
+});
+
+app.delete('/api/jobs/:jobId', async (req, res) => {
+  try {
+    const pythonResponse = await axios.delete(`${PYTHON_API_URL}/jobs/${encodeURIComponent(req.params.jobId)}`);
+    res.json(pythonResponse.data);
+  } catch (error) {
+    sendJobError(res, error, 'Job cancellation failed');
+  }
+});
+
 // Upload tree GLB to Forma and return blobId
 app.post('/api/upload-tree-to-forma', async (req, res) => {
   try {
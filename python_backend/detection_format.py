@@ -0,0 +1,260 @@
+"""
+Columnar detection response - flat typed arrays instead of nested JSON lists
+Encodes a detect_trees_in_image result as NumPy .npz or a little-endian binary layout with a JSON header
+"""
+
+import io
+import json
+import struct
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Response formats of /detect-trees and their media types (also used for Accept negotiation)
+DETECTION_FORMATS = ("json", "npz", "binary")
+DETECTION_MEDIA_TYPES = {
+    "json": "application/json",
+    "npz": "application/x-npz",
+    "binary": "application/vnd.forma-trees"
+}
+
+# Binary layout: magic, u32 header length, JSON header (space-padded to 8
+# bytes), then the arrays, each starting at an 8-byte aligned offset
+BINARY_MAGIC = b"FTD1"
+_ALIGN = 8
+
+# Record columns per table: (key, kind, dtype)
+#   scalar  - one value per record                  -> (n,)
+#   pair    - [x, y] per record                     -> (n, 2)
+#   polygon - list of [x, y] per record             -> (points, 2) + offsets (n + 1,)
+# Meter values are rounded to 2 decimals in JSON; float32 keeps that exact
+# for coordinates up to ~65 km, areas stay float64
+_TREE_COLUMNS = (
+    ("centroidPx", "pair", "<i4"),
+    ("centroidM", "pair", "<f4"),
+    ("areaM2", "scalar", "<f8"),
+    ("estimatedDiameterM", "scalar", "<f4"),
+    ("polygonPx", "polygon", "<i4"),
+    ("polygonM", "polygon", "<f4")
+)
+_POPULATED_COLUMNS = (
+    ("positionPx", "pair", "<i4"),
+    ("positionM", "pair", "<f4"),
+    ("estimatedDiameterM", "scalar", "<f4")
+)
+# Tables and their nested tables (cluster -> populated trees, with offsets)
+_TABLES = {
+    "individualTrees": (_TREE_COLUMNS, None),
+    "treeClusters": (_TREE_COLUMNS, ("populatedTrees", _POPULATED_COLUMNS))
+}
+
+
+def _encode_table(
+    name: str,
+    records: List[Dict[str, Any]],
+    columns: Tuple[Tuple[str, str, str], ...],
+    arrays: Dict[str, np.ndarray]
+) -> Dict[str, Any]:
+    """Add one table's column arrays to `arrays`; returns its header entry."""
+    present = [column for column in columns if records and column[0] in records[0]]
+    for key, kind, dtype in present:
+        values = [record[key] for record in records]
+        if kind == "scalar":
+            arrays[f"{name}.{key}"] = np.array(values, dtype=dtype)
+        elif kind == "pair":
+            arrays[f"{name}.{key}"] = np.array(values, dtype=dtype).reshape(-1, 2)
+        else:
+            counts = np.fromiter((len(polygon) for polygon in values), dtype=np.int64, count=len(values))
+            offsets = np.zeros(len(values) + 1, dtype="<i4")
+            np.cumsum(counts, out=offsets[1:])
+            flat = np.fromiter(chain.from_iterable(chain.from_iterable(values)), dtype=dtype, count=2 * int(offsets[-1]))
+            arrays[f"{name}.{key}"] = flat.reshape(-1, 2)
+            arrays[f"{name}.{key}.offsets"] = offsets
+    return {
+        "count": len(records),
+        "type": records[0].get("type") if records else None,
+        "columns": {key: kind for key, kind, _ in present}
+    }
+
+
+def columnar_arrays(result: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Split a detection result into a JSON header and flat column arrays.
+
+    Arrays are named "<table>.<key>" (plus ".offsets" for polygons and
+    nested tables: row i's points/trees are offsets[i]:offsets[i + 1]).
+    Everything that is not a tree table (resultId, metadata, summary, ...)
+    goes into the header unchanged.
+
+    Returns:
+        (header, {name: array})
+    """
+    header: Dict[str, Any] = {key: value for key, value in result.items() if key not in _TABLES}
+    header["tables"] = {}
+    arrays: Dict[str, np.ndarray] = {}
+    for name, (columns, nested) in _TABLES.items():
+        records = result.get(name, [])
+        header["tables"][name] = _encode_table(name, records, columns, arrays)
+        if nested is None:
+            continue
+        nested_key, nested_columns = nested
+        children = [record.get(nested_key, []) for record in records]
+        counts = np.fromiter((len(c) for c in children), dtype=np.int64, count=len(children))
+        offsets = np.zeros(len(children) + 1, dtype="<i4")
+        np.cumsum(counts, out=offsets[1:])
+        nested_name = f"{name}.{nested_key}"
+        arrays[f"{nested_name}.offsets"] = offsets
+        header["tables"][nested_name] = _encode_table(
+            nested_name, list(chain.from_iterable(children)), nested_columns, arrays
+        )
+    return header, arrays
+
+
+def encode_npz(result: Dict[str, Any]) -> bytes:
+    """Detection result as an uncompressed .npz; the JSON header is the uint8 array "header"."""
+    header, arrays = columnar_arrays(result)
+    buffer = io.BytesIO()
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    np.savez(buffer, header=np.frombuffer(header_bytes, dtype=np.uint8), **arrays)
+    return buffer.getvalue()
+
+
+def encode_binary(result: Dict[str, Any]) -> bytes:
+    """
+    Detection result in the little-endian binary layout.
+
+    The header's "arrays" list gives each array's name, dtype, shape and
+    byte offset from the end of the header, so a browser can view them
+    as typed arrays without copying.
+    """
+    header, arrays = columnar_arrays(result)
+    parts = []
+    entries = []
+    offset = 0
+    for name, array in arrays.items():
+        raw = np.ascontiguousarray(array).tobytes()
+        entries.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        padding = (-len(raw)) % _ALIGN
+        parts.append(raw + b"\0" * padding)
+        offset += len(raw) + padding
+    header["arrays"] = entries
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * ((-(len(header_bytes) + 8)) % _ALIGN)
+    return b"".join([BINARY_MAGIC, struct.pack("<I", len(header_bytes)), header_bytes] + parts)
+
+
+def encode_columnar(result: Dict[str, Any], response_format: str) -> bytes:
+    """Serialize a detection result as "npz" or "binary"."""
+    if response_format == "npz":
+        return encode_npz(result)
+    if response_format == "binary":
+        return encode_binary(result)
+    raise ValueError(f"Not a columnar response format: {response_format}")
+
+
+def sniff_format(data: bytes) -> str:
+    """Which of DETECTION_FORMATS a serialized response is in."""
+    if data[:4] == BINARY_MAGIC:
+        return "binary"
+    if data[:2] == b"PK":
+        return "npz"
+    return "json"
+
+
+def read_columnar(data: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Header and arrays of an npz or binary detection response.
+
+    Raises:
+        ValueError: If the data is in neither format
+    """
+    response_format = sniff_format(data)
+    if response_format == "binary":
+        (header_length,) = struct.unpack_from("<I", data, 4)
+        header = json.loads(data[8:8 + header_length])
+        start = 8 + header_length
+        arrays = {}
+        for entry in header.pop("arrays"):
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"]))
+            arrays[entry["name"]] = np.frombuffer(
+                data, dtype=dtype, count=count, offset=start + entry["offset"]
+            ).reshape(entry["shape"])
+        return header, arrays
+    if response_format == "npz":
+        with np.load(io.BytesIO(data)) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        header = json.loads(arrays.pop("header").tobytes())
+        return header, arrays
+    raise ValueError("Not an npz or binary detection response")
+
+
+def _decode_table(
+    name: str,
+    info: Dict[str, Any],
+    arrays: Dict[str, np.ndarray]
+) -> List[Dict[str, Any]]:
+    count = info["count"]
+    records: List[Dict[str, Any]] = [{} for _ in range(count)]
+    if info.get("type") is not None:
+        for record in records:
+            record["type"] = info["type"]
+    for key, kind in info["columns"].items():
+        array = arrays[f"{name}.{key}"]
+        # Meter values were rounded to 2 decimals before going to float32
+        values = np.round(array.astype(np.float64), 2) if array.dtype.kind == "f" else array
+        values = values.tolist()
+        if kind == "polygon":
+            offsets = arrays[f"{name}.{key}.offsets"].tolist()
+            values = [values[offsets[i]:offsets[i + 1]] for i in range(count)]
+        for record, value in zip(records, values):
+            record[key] = value
+    return records
+
+
+def decode_columnar(data: bytes) -> Dict[str, Any]:
+    """
+    Rebuild the JSON-style detection result from an npz or binary response.
+
+    Values match the JSON response (meters rounded to 2 decimals); key
+    order within records may differ.
+
+    Raises:
+        ValueError: If the data is in neither format
+    """
+    header, arrays = read_columnar(data)
+    tables = header.pop("tables")
+    result = dict(header)
+    for name, (_, nested) in _TABLES.items():
+        records = _decode_table(name, tables[name], arrays)
+        if nested is not None:
+            nested_key = nested[0]
+            nested_name = f"{name}.{nested_key}"
+            children = _decode_table(nested_name, tables[nested_name], arrays)
+            offsets = arrays[f"{nested_name}.offsets"].tolist()
+            for i, record in enumerate(records):
+                record[nested_key] = children[offsets[i]:offsets[i + 1]]
+        result[name] = records
+    return result
+
+
+def negotiate_format(response_format: Optional[str], accept: Optional[str]) -> str:
+    """
+    Response format from an explicit `response_format` or the Accept header.
+
+    Raises:
+        ValueError: For an unknown response_format
+    """
+    if response_format:
+        if response_format not in DETECTION_FORMATS:
+            raise ValueError(f"response_format must be one of {', '.join(DETECTION_FORMATS)}")
+        return response_format
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip()
+        for name, known in DETECTION_MEDIA_TYPES.items():
+            if media_type == known and name != "json":
+                return name
+    return "json"
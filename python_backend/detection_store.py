@@ -0,0 +1,45 @@
+"""
+Detection result store - keep /detect-trees results server-side under a result id
+In-memory LRU tier that spills to disk; entries expire after a TTL without use
+"""
+
+import os
+import re
+import tempfile
+from typing import Optional
+
+from result_cache import ResultCache
+
+
+DEFAULT_MEMORY_MB = int(os.environ.get('DETECTION_STORE_MB', '256'))
+DEFAULT_DISK_DIR = os.environ.get('DETECTION_STORE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'forma-detection-results'
+)
+DEFAULT_DISK_MB = int(os.environ.get('DETECTION_STORE_DISK_MB', '2048'))
+DEFAULT_TTL = int(os.environ.get('DETECTION_STORE_TTL_S', '3600'))
+
+# Result ids are make_cache_key digests; anything else is never a file name
+_RESULT_ID = re.compile(r"[0-9a-f]{64}")
+
+
+class DetectionResultStore(ResultCache):
+    """
+    Serialized detection results by result id, for /generate-model.
+
+    New results go to memory; the least recently used ones spill to
+    `disk_dir` once the memory budget is exceeded, and are dropped from
+    disk past its budget. A result unused for `ttl_seconds` expires in
+    both tiers. put() raises ValueError for anything but a result id.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = DEFAULT_MEMORY_MB * 1024 * 1024,
+        disk_dir: Optional[str] = DEFAULT_DISK_DIR,
+        max_disk_bytes: int = DEFAULT_DISK_MB * 1024 * 1024,
+        ttl_seconds: float = DEFAULT_TTL
+    ):
+        super().__init__(
+            max_memory_bytes, disk_dir, max_disk_bytes,
+            ttl_seconds=ttl_seconds, key_pattern=_RESULT_ID, write_through=False
+        )
@@ -0,0 +1,193 @@
+"""
+Instanced binary glTF (GLB) writer - store the base tree mesh once and each tree as a transform
+Uses EXT_mesh_gpu_instancing (one node, per-instance attribute buffers) or, as a
+fallback for viewers without the extension, one node per tree sharing the mesh
+"""
+
+import json
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+GLB_MAGIC = 0x46546C67  # "glTF"
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A  # "JSON"
+CHUNK_BIN = 0x004E4942   # "BIN\0"
+
+# glTF enums
+COMPONENT_FLOAT = 5126
+COMPONENT_UNSIGNED_SHORT = 5123
+COMPONENT_UNSIGNED_INT = 5125
+TARGET_ARRAY_BUFFER = 34962
+TARGET_ELEMENT_ARRAY_BUFFER = 34963
+MODE_TRIANGLES = 4
+
+INSTANCING_EXTENSION = "EXT_mesh_gpu_instancing"
+
+# Same green as the OBJ material (Kd 0.3 0.7 0.3)
+TREE_COLOR = [0.3, 0.7, 0.3, 1.0]
+
+
+class _BinaryBuffer:
+    """Accumulates 4-byte aligned buffer views and their accessors."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.length = 0
+        self.buffer_views: List[Dict[str, Any]] = []
+        self.accessors: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        array: np.ndarray,
+        component_type: int,
+        accessor_type: str,
+        target: Optional[int] = None,
+        with_bounds: bool = False
+    ) -> int:
+        """Append an array (written little-endian) and return its accessor index."""
+        dtype = {
+            COMPONENT_FLOAT: '<f4',
+            COMPONENT_UNSIGNED_SHORT: '<u2',
+            COMPONENT_UNSIGNED_INT: '<u4'
+        }[component_type]
+        data = np.ascontiguousarray(array, dtype=dtype)
+        raw = data.tobytes()
+        view = {"buffer": 0, "byteOffset": self.length, "byteLength": len(raw)}
+        if target is not None:
+            view["target"] = target
+        self.buffer_views.append(view)
+
+        padding = (-len(raw)) % 4
+        self.parts.append(raw + b"\0" * padding)
+        self.length += len(raw) + padding
+
+        accessor = {
+            "bufferView": len(self.buffer_views) - 1,
+            "componentType": component_type,
+            "count": int(data.shape[0]),
+            "type": accessor_type
+        }
+        if with_bounds:
+            accessor["min"] = data.min(axis=0).tolist()
+            accessor["max"] = data.max(axis=0).tolist()
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def tobytes(self) -> bytes:
+        return b"".join(self.parts)
+
+
+def build_instanced_glb(groups: Sequence[Dict[str, Any]], instancing: bool = True) -> bytes:
+    """
+    Write a GLB where each group's mesh is stored once and placed at every
+    one of its translations/scales.
+
+    Args:
+        groups: Dicts with "name", "vertices" ((n, 3) positions, already
+            Y-up), "triangles" ((t, 3) 0-based indices), "translations"
+            ((trees, 3)) and "scales" ((trees,) uniform scale)
+        instancing: Use EXT_mesh_gpu_instancing (one node per group, ~24
+            bytes per tree); otherwise one node per tree in the JSON chunk
+
+    Returns:
+        GLB file bytes
+    """
+    buffer = _BinaryBuffer()
+    meshes: List[Dict[str, Any]] = []
+    nodes: List[Dict[str, Any]] = [{"name": "Trees", "children": []}]
+
+    for mesh_index, group in enumerate(groups):
+        vertices = group["vertices"]
+        name = group["name"]
+        position = buffer.add(vertices, COMPONENT_FLOAT, "VEC3", TARGET_ARRAY_BUFFER, with_bounds=True)
+        index_type = COMPONENT_UNSIGNED_SHORT if len(vertices) <= 0xFFFF else COMPONENT_UNSIGNED_INT
+        indices = buffer.add(group["triangles"].reshape(-1), index_type, "SCALAR", TARGET_ELEMENT_ARRAY_BUFFER)
+        meshes.append({
+            "name": name,
+            "primitives": [{
+                "attributes": {"POSITION": position},
+                "indices": indices,
+                "material": 0,
+                "mode": MODE_TRIANGLES
+            }]
+        })
+
+        translations = group["translations"]
+        scales = np.asarray(group["scales"], dtype=np.float64)
+        if not len(translations):
+            continue
+        if instancing:
+            # Per-instance attributes: TRANSLATION and SCALE (no rotation needed)
+            instance_translation = buffer.add(translations, COMPONENT_FLOAT, "VEC3")
+            instance_scale = buffer.add(np.repeat(scales[:, None], 3, axis=1), COMPONENT_FLOAT, "VEC3")
+            nodes[0]["children"].append(len(nodes))
+            nodes.append({
+                "name": name,
+                "mesh": mesh_index,
+                "extensions": {
+                    INSTANCING_EXTENSION: {
+                        "attributes": {
+                            "TRANSLATION": instance_translation,
+                            "SCALE": instance_scale
+                        }
+                    }
+                }
+            })
+        else:
+            # Shared mesh nodes: every tree is a child node referencing the mesh
+            names = group.get("instance_names") or [f"{name}_{i + 1}" for i in range(len(scales))]
+            translations_list = np.asarray(translations, dtype=np.float32).tolist()
+            scales_list = scales.astype(np.float32).tolist()
+            nodes[0]["children"].extend(range(len(nodes), len(nodes) + len(scales_list)))
+            nodes.extend(
+                {
+                    "name": names[i],
+                    "mesh": mesh_index,
+                    "translation": translations_list[i],
+                    "scale": [scales_list[i]] * 3
+                }
+                for i in range(len(scales_list))
+            )
+
+    if not nodes[0]["children"]:
+        del nodes[0]["children"]
+
+    gltf: Dict[str, Any] = {
+        "asset": {"version": "2.0", "generator": "Forma Tree Detection"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": nodes,
+        "materials": [{
+            "name": "tree_material",
+            "pbrMetallicRoughness": {
+                "baseColorFactor": TREE_COLOR,
+                "metallicFactor": 0.0,
+                "roughnessFactor": 0.9
+            }
+        }],
+        "meshes": meshes
+    }
+    if instancing:
+        gltf["extensionsUsed"] = [INSTANCING_EXTENSION]
+        # Without the extension a viewer would draw a single tree per group
+        gltf["extensionsRequired"] = [INSTANCING_EXTENSION]
+
+    binary = buffer.tobytes()
+    gltf["buffers"] = [{"byteLength": len(binary)}]
+    gltf["bufferViews"] = buffer.buffer_views
+    gltf["accessors"] = buffer.accessors
+
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * ((-len(json_chunk)) % 4)
+
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    return b"".join([
+        struct.pack("<III", GLB_MAGIC, GLB_VERSION, total),
+        struct.pack("<II", len(json_chunk), CHUNK_JSON),
+        json_chunk,
+        struct.pack("<II", len(binary), CHUNK_BIN),
+        binary
+    ])
@@ -0,0 +1,190 @@
+"""
+HSV histogram sweeps - answer "what would this range select?" without the image
+Builds a 3D HSV histogram once, then counts pixels for batches of candidate
+ranges from its prefix sums (8 table lookups per range)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from hsv_lut import HsvRange, hsv_range
+
+
+# OpenCV 8-bit HSV: hue 0-179, saturation/value 0-255
+HUE_LEVELS = 180
+SV_LEVELS = 256
+
+# Memory budget for cached histograms (~48MB each)
+DEFAULT_MAX_CACHE_MB = int(os.environ.get('HSV_HISTOGRAM_CACHE_MB', '256'))
+
+# Unions are counted by inclusion-exclusion over 2^n - 1 boxes
+MAX_UNION_RANGES = 8
+
+# A candidate is one thresholds dict or a list of them (union)
+Candidate = Union[Dict[str, Dict[str, int]], List[Dict[str, Dict[str, int]]]]
+
+
+class HsvHistogram:
+    """
+    Full-resolution 3D HSV histogram stored as a zero-padded prefix-sum table.
+
+    `prefix[h, s, v]` is the number of pixels with hue < h, saturation < s
+    and value < v, so any box of bins is counted with 8 lookups.
+    """
+
+    def __init__(self, hsv: np.ndarray):
+        hue = hsv[..., 0].astype(np.int32)
+        index = hue << 16
+        index |= hsv[..., 1].astype(np.int32) << 8
+        index |= hsv[..., 2]
+        counts = np.bincount(index.ravel(), minlength=HUE_LEVELS * SV_LEVELS * SV_LEVELS)
+        del index, hue
+        counts = counts.reshape(HUE_LEVELS, SV_LEVELS, SV_LEVELS)
+
+        self.total_pixels = int(hsv.shape[0] * hsv.shape[1])
+        self.channels = {
+            "hue": counts.sum(axis=(1, 2)).tolist(),
+            "saturation": counts.sum(axis=(0, 2)).tolist(),
+            "value": counts.sum(axis=(0, 1)).tolist()
+        }
+
+        # uint32 holds any image below 4 gigapixels and halves the table
+        self.prefix = np.zeros((HUE_LEVELS + 1, SV_LEVELS + 1, SV_LEVELS + 1), dtype=np.uint32)
+        table = self.prefix[1:, 1:, 1:]
+        table[...] = counts
+        del counts
+        for axis in range(3):
+            np.cumsum(table, axis=axis, dtype=np.uint32, out=table)
+        self.prefix.flags.writeable = False
+
+    @property
+    def nbytes(self) -> int:
+        return self.prefix.nbytes
+
+    def count_boxes(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        Pixels inside each inclusive box (same semantics as cv2.inRange).
+
+        Args:
+            lower: (n, 3) array of (h, s, v) minimums
+            upper: (n, 3) array of (h, s, v) maximums
+
+        Returns:
+            (n,) int64 array of pixel counts (0 for empty boxes)
+        """
+        limits = np.array([HUE_LEVELS, SV_LEVELS, SV_LEVELS])
+        lo = np.clip(np.asarray(lower, dtype=np.int64), 0, limits)
+        hi = np.clip(np.asarray(upper, dtype=np.int64) + 1, 0, limits)
+        hi = np.maximum(hi, lo)
+
+        p = self.prefix
+        h0, s0, v0 = lo.T
+        h1, s1, v1 = hi.T
+        total = (p[h1, s1, v1].astype(np.int64)
+                 - p[h0, s1, v1] - p[h1, s0, v1] - p[h1, s1, v0]
+                 + p[h0, s0, v1] + p[h0, s1, v0] + p[h1, s0, v0]
+                 - p[h0, s0, v0])
+        return total
+
+    def coverage(self, candidates: Sequence[Candidate]) -> List[Dict[str, Any]]:
+        """
+        Pixel count and fraction selected by each candidate.
+
+        A candidate is a thresholds dict ({"hue": {"min", "max"}, ...}) or a
+        list of them, counted as their union like the detector's OR-ed ranges.
+
+        Raises:
+            ValueError: If a candidate is malformed or unions too many ranges
+        """
+        # Flatten every union into signed boxes (inclusion-exclusion), then
+        # count all boxes of the batch in one vectorized lookup
+        lowers, uppers, signs, owners = [], [], [], []
+        for i, candidate in enumerate(candidates):
+            ranges = [_parse_range(t) for t in (candidate if isinstance(candidate, list) else [candidate])]
+            if not 1 <= len(ranges) <= MAX_UNION_RANGES:
+                raise ValueError(f"A candidate must union 1-{MAX_UNION_RANGES} ranges, got {len(ranges)}")
+            for size in range(1, len(ranges) + 1):
+                sign = 1 if size % 2 else -1
+                for subset in combinations(ranges, size):
+                    lowers.append(np.max([r[0] for r in subset], axis=0))
+                    uppers.append(np.min([r[1] for r in subset], axis=0))
+                    signs.append(sign)
+                    owners.append(i)
+
+        counts = np.zeros(len(candidates), dtype=np.int64)
+        if lowers:
+            boxes = self.count_boxes(np.array(lowers), np.array(uppers))
+            np.add.at(counts, np.array(owners), boxes * np.array(signs))
+
+        return [
+            {
+                "pixels": int(n),
+                "fraction": float(n) / self.total_pixels if self.total_pixels else 0.0
+            }
+            for n in counts
+        ]
+
+
+def _parse_range(thresholds: Dict[str, Dict[str, int]]) -> HsvRange:
+    try:
+        return hsv_range(thresholds)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid HSV range {thresholds!r}: {e}")
+
+
+class HsvHistogramCache:
+    """
+    Thread-safe LRU of HsvHistogram objects keyed by image content hash,
+    bounded by total table size.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._histograms: "OrderedDict[str, HsvHistogram]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str) -> Optional[HsvHistogram]:
+        """Look up a histogram and mark it as recently used (None if unknown/evicted)."""
+        with self._lock:
+            histogram = self._histograms.get(content_hash)
+            if histogram is not None:
+                self._histograms.move_to_end(content_hash)
+            return histogram
+
+    def get_or_build(self, content_hash: str, hsv: Callable[[], np.ndarray]) -> Tuple[HsvHistogram, bool]:
+        """
+        Return the cached histogram for an image, building it from `hsv()` on a miss.
+
+        Returns:
+            Tuple of (histogram, was_cached)
+        """
+        histogram = self.get(content_hash)
+        if histogram is not None:
+            return histogram, True
+
+        histogram = HsvHistogram(hsv())
+        with self._lock:
+            previous = self._histograms.pop(content_hash, None)
+            if previous is not None:
+                self._total_bytes -= previous.nbytes
+            self._histograms[content_hash] = histogram
+            self._total_bytes += histogram.nbytes
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while self._total_bytes > self.max_bytes and len(self._histograms) > 1:
+                _, evicted = self._histograms.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+        return histogram, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "histograms": len(self._histograms),
+                "cachedMB": round(self._total_bytes / (1024 * 1024), 2),
+                "maxMB": round(self.max_bytes / (1024 * 1024), 2)
+            }
@@ -0,0 +1,119 @@
+"""
+BGR -> vegetation mask lookup tables
+Thresholds the decoded image directly, without allocating an HSV copy
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+# (lower, upper) HSV bounds, each a (h, s, v) tuple - hashable so LUTs can be cached
+HsvRange = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+
+# Bits kept per BGR channel. 8 is exact (16MB table); fewer bits quantize
+# each channel to its bin centre and shrink the table to 2^(3*bits) bytes.
+LUT_BITS = (4, 5, 6, 7, 8)
+
+# Image rows converted per step when applying a table; bounds the temporary
+# index buffer to a band instead of a full-image copy
+_BAND_ROWS = 128
+
+
+def hsv_range(hsv_thresholds: Dict[str, Dict[str, int]]) -> HsvRange:
+    """Convert the API's {"hue": {"min", "max"}, ...} dict to (lower, upper) tuples."""
+    return (
+        (int(hsv_thresholds["hue"]["min"]),
+         int(hsv_thresholds["saturation"]["min"]),
+         int(hsv_thresholds["value"]["min"])),
+        (int(hsv_thresholds["hue"]["max"]),
+         int(hsv_thresholds["saturation"]["max"]),
+         int(hsv_thresholds["value"]["max"]))
+    )
+
+
+def hsv_ranges_mask(hsv: np.ndarray, ranges: Sequence[HsvRange]) -> np.ndarray:
+    """OR of cv2.inRange over several ranges of an HSV image."""
+    mask = None
+    for lower, upper in ranges:
+        in_range = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        mask = in_range if mask is None else cv2.bitwise_or(mask, in_range, dst=mask)
+    return mask
+
+
+@lru_cache(maxsize=4)
+def build_bgr_lut(ranges: Tuple[HsvRange, ...], bits: int = 8) -> np.ndarray:
+    """
+    Tabulate mask membership for every (quantized) BGR colour.
+
+    Entry (r << 2*bits) | (g << bits) | b is 255 when the colour falls in
+    any of `ranges` after OpenCV's BGR->HSV conversion, so the table
+    reproduces cvtColor + inRange exactly at 8 bits. Cached per process.
+
+    Args:
+        ranges: Tuple of (lower, upper) HSV bounds, OR-ed together
+        bits: Bits per channel, one of LUT_BITS
+
+    Returns:
+        Read-only uint8 array of 2^(3*bits) entries
+    """
+    if bits not in LUT_BITS:
+        raise ValueError(f"Unsupported LUT precision {bits}, expected one of {LUT_BITS}")
+
+    levels = 1 << bits
+    shift = 8 - bits
+    # Quantized bins are represented by their centre value
+    values = (np.arange(levels, dtype=np.uint16) << shift) + ((1 << shift) >> 1)
+    values = values.astype(np.uint8)
+
+    # One red plane at a time: a (green, blue) grid of colours through the
+    # same conversion the HSV engine uses
+    plane = np.empty((levels, levels, 3), dtype=np.uint8)
+    plane[:, :, 0] = values[np.newaxis, :]
+    plane[:, :, 1] = values[:, np.newaxis]
+    lut = np.empty((levels, levels, levels), dtype=np.uint8)
+    for r_index, r_value in enumerate(values):
+        plane[:, :, 2] = r_value
+        lut[r_index] = hsv_ranges_mask(cv2.cvtColor(plane, cv2.COLOR_BGR2HSV), ranges)
+
+    lut = lut.reshape(-1)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_bgr_lut(img: np.ndarray, lut: np.ndarray, bits: int = 8) -> np.ndarray:
+    """
+    Threshold a BGR image through a table from build_bgr_lut.
+
+    Works in bands of rows so the only temporaries are a few rows of
+    packed colour indices; the mask is written in place.
+    """
+    height, width = img.shape[:2]
+    mask = np.empty((height, width), dtype=np.uint8)
+
+    if bits == 8:
+        # Packing into BGRA lets a uint32 view of each pixel serve as the
+        # index (little endian: b | g << 8 | r << 16); alpha stays zero
+        band = np.zeros((_BAND_ROWS, width, 4), dtype=np.uint8)
+        for y0 in range(0, height, _BAND_ROWS):
+            rows = min(_BAND_ROWS, height - y0)
+            packed = band[:rows]
+            cv2.mixChannels([img[y0:y0 + rows]], [packed], [0, 0, 1, 1, 2, 2])
+            np.take(lut, packed.view(np.uint32)[..., 0], out=mask[y0:y0 + rows])
+        return mask
+
+    shift = 8 - bits
+    for y0 in range(0, height, _BAND_ROWS):
+        window = img[y0:y0 + _BAND_ROWS]
+        index = (window[..., 2] >> shift).astype(np.intp) << (2 * bits)
+        index |= (window[..., 1] >> shift).astype(np.intp) << bits
+        index |= window[..., 0] >> shift
+        np.take(lut, index, out=mask[y0:y0 + window.shape[0]])
+    return mask
+
+
+def describe_ranges(ranges: Sequence[HsvRange]) -> List[Dict[str, List[int]]]:
+    """JSON-friendly form of a list of ranges for response metadata."""
+    return [{"lower": list(lower), "upper": list(upper)} for lower, upper in ranges]
@@ -0,0 +1,106 @@
+"""
+Resolution-aware image decoding - decode uploads no finer than the detection needs
+Picks an IMREAD_REDUCED_COLOR_{2,4,8} mode from the header dimensions, then area-downscales the remainder
+"""
+
+import math
+import struct
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# Decoder-side reductions, largest first. libjpeg scales during the IDCT, so
+# a reduced JPEG decode never holds the full-size image; other formats are
+# decoded in full and resized by OpenCV
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start-of-frame markers (DHT, JPG and DAC share the range)
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def image_dimensions(contents: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a PNG or JPEG header without decoding; None for other formats."""
+    if contents[:8] == _PNG_SIGNATURE and contents[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", contents[16:24])
+        return width, height
+    if contents[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(contents):
+        if contents[pos] != 0xFF:
+            return None
+        marker = contents[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Standalone markers carry no length
+            pos += 2
+            continue
+        (length,) = struct.unpack(">H", contents[pos + 2:pos + 4])
+        if marker in _JPEG_SOF:
+            if pos + 9 > len(contents):
+                return None
+            height, width = struct.unpack(">HH", contents[pos + 5:pos + 9])
+            # Height 0 means it is only given later (DNL marker)
+            return (width, height) if width and height else None
+        pos += 2 + length
+    return None
+
+
+def target_size(real_dimensions: Dict[str, float], target_meters_per_pixel: float) -> Tuple[int, int]:
+    """Smallest (width, height) in pixels that keeps both axes at or below the target scale."""
+    return (
+        max(1, math.ceil(real_dimensions["width"] / target_meters_per_pixel - 1e-9)),
+        max(1, math.ceil(real_dimensions["height"] / target_meters_per_pixel - 1e-9))
+    )
+
+
+def reduced_decode_flags(
+    contents: bytes,
+    real_dimensions: Dict[str, float],
+    target_meters_per_pixel: float
+) -> Tuple[int, int]:
+    """
+    Largest decoder reduction that still leaves at least the target size.
+
+    The header does not say whether EXIF orientation will swap the axes,
+    so a reduction must fit both ways round.
+
+    Returns:
+        (reduction factor, cv2.imdecode flags); (1, IMREAD_COLOR) if the
+        format's header is not understood or no reduction fits
+    """
+    source = image_dimensions(contents)
+    if source is not None:
+        width, height = source
+        target_width, target_height = target_size(real_dimensions, target_meters_per_pixel)
+        for factor, flags in REDUCED_DECODE_FLAGS:
+            if all(
+                math.ceil(w / factor) >= target_width and math.ceil(h / factor) >= target_height
+                for w, h in ((width, height), (height, width))
+            ):
+                return factor, flags
+    return 1, cv2.IMREAD_COLOR
+
+
+def downscale_image(
+    img: np.ndarray,
+    real_dimensions: Dict[str, float],
+    target_meters_per_pixel: float
+) -> np.ndarray:
+    """Area-downscale `img` to target_size (never upscales; returns `img` if already there)."""
+    height, width = img.shape[:2]
+    target_width, target_height = target_size(real_dimensions, target_meters_per_pixel)
+    size = (min(width, target_width), min(height, target_height))
+    if size == (width, height):
+        return img
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,122 @@
+"""
+Image sessions - upload a tile once, re-run thresholding/detection many times
+Keeps decoded BGR and HSV arrays in a memory-bounded LRU cache
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import cv2
+import numpy as np
+
+
+# Memory budget for cached sessions (BGR + HSV = 6 bytes per pixel)
+DEFAULT_MAX_CACHE_MB = int(os.environ.get('IMAGE_SESSION_CACHE_MB', '1024'))
+
+
+class ImageSession:
+    """A decoded upload with its HSV conversion, ready for repeated detection."""
+
+    def __init__(
+        self,
+        session_id: str,
+        bgr: np.ndarray,
+        filename: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ):
+        self.session_id = session_id
+        self.bgr = bgr
+        self.hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        self.filename = filename
+        # SHA-256 of the uploaded bytes; lets sessions share result cache entries with uploads
+        self.content_hash = content_hash or session_id
+        self.created = datetime.now()
+        # Arrays are shared between concurrent requests; nobody may write to them
+        self.bgr.flags.writeable = False
+        self.hsv.flags.writeable = False
+
+    @property
+    def nbytes(self) -> int:
+        return self.bgr.nbytes + self.hsv.nbytes
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly summary returned to clients."""
+        height, width = self.bgr.shape[:2]
+        return {
+            "sessionId": self.session_id,
+            "filename": self.filename,
+            "imageDimensionsPx": {"width": width, "height": height},
+            "cachedMB": round(self.nbytes / (1024 * 1024), 2),
+            "created": self.created.isoformat()
+        }
+
+
+class ImageSessionStore:
+    """
+    Thread-safe LRU of ImageSession objects bounded by total array size.
+
+    Least recently used sessions are evicted once the budget is exceeded;
+    clients holding an evicted id get a 404 and simply upload again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, ImageSession]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def create(
+        self,
+        bgr: np.ndarray,
+        filename: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> ImageSession:
+        """
+        Store a decoded image and return its session.
+
+        Raises:
+            ValueError: If the image alone exceeds the cache budget
+        """
+        session = ImageSession(uuid.uuid4().hex, bgr, filename, content_hash)
+        if session.nbytes > self.max_bytes:
+            raise ValueError(
+                f"Image needs {session.nbytes / (1024 * 1024):.0f}MB, more than the "
+                f"{self.max_bytes / (1024 * 1024):.0f}MB session cache"
+            )
+
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._total_bytes += session.nbytes
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._sessions.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+        return session
+
+    def get(self, session_id: str) -> Optional[ImageSession]:
+        """Look up a session and mark it as recently used (None if unknown/evicted)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        """Drop a session. Returns False if it did not exist."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._total_bytes -= session.nbytes
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "cachedMB": round(self._total_bytes / (1024 * 1024), 2),
+                "maxMB": round(self.max_bytes / (1024 * 1024), 2)
+            }
@@ -0,0 +1,304 @@
+"""
+Background jobs - run detection/model generation off the request path
+Bounded process pool, queue-depth limit, per-job timing and result expiry
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Jobs allowed to wait for a worker (running jobs don't count)
+DEFAULT_MAX_QUEUED = int(os.environ.get('JOB_QUEUE_MAX', '16'))
+# Seconds a finished job (and its result) is kept for polling
+DEFAULT_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL_S', '900'))
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobQueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at its depth limit."""
+
+
+class Job:
+    """One submitted unit of work and, once finished, its result or error."""
+
+    def __init__(self, kind: str, fn: Callable[..., bytes], args: Tuple[Any, ...], media_type: str,
+                 headers: Optional[Dict[str, str]] = None,
+                 on_result: Optional[Callable[[bytes], None]] = None,
+                 on_done: Optional[Callable[[], None]] = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.on_result = on_result
+        self.on_done = on_done
+
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.run_seconds: Optional[float] = None
+
+        self.result: Optional[bytes] = None
+        self.error_status: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly status returned to pollers."""
+        now = time.time()
+        started = self.started or now
+        info = {
+            "jobId": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "submitted": datetime.fromtimestamp(self.submitted).isoformat(),
+            "queueSeconds": round(started - self.submitted, 3),
+            "runSeconds": round(self.run_seconds, 3) if self.run_seconds is not None
+            else (round(now - self.started, 3) if self.started else None)
+        }
+        if self.status == "done":
+            info["resultBytes"] = len(self.result)
+        if self.status == "failed":
+            info["error"] = self.error
+            info["errorStatus"] = self.error_status
+        return info
+
+
+def _run_job(fn: Callable[..., bytes], args: Tuple[Any, ...]) -> Tuple[bool, Any, float]:
+    """
+    Worker: run one job, never raising (exceptions may not survive pickling).
+
+    Returns:
+        (ok, result bytes or (status_code, message), run seconds)
+    """
+    start = time.perf_counter()
+    try:
+        return True, fn(*args), time.perf_counter() - start
+    except ValueError as e:
+        return False, (400, str(e)), time.perf_counter() - start
+    except Exception as e:
+        # HTTPException-style errors carry their own status and detail
+        status = getattr(e, "status_code", 500)
+        return False, (status, str(getattr(e, "detail", None) or e)), time.perf_counter() - start
+
+
+class JobQueue:
+    """
+    FIFO of jobs dispatched to a process pool of `max_workers`.
+
+    At most `max_workers` jobs sit in the pool at a time, so "running" is
+    accurate and queued jobs can still be cancelled. Finished jobs are kept
+    for `result_ttl` seconds. All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_WORKERS,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        result_ttl: float = DEFAULT_RESULT_TTL
+    ):
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.result_ttl = result_ttl
+
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending: "deque[Job]" = deque()
+        self._running = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Re-entrant: a future that is already done runs its callback inline
+        self._lock = threading.RLock()
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[..., bytes],
+        args: Tuple[Any, ...],
+        media_type: str = "application/json",
+        headers: Optional[Dict[str, str]] = None,
+        on_result: Optional[Callable[[bytes], None]] = None,
+        on_done: Optional[Callable[[], None]] = None
+    ) -> Job:
+        """
+        Queue `fn(*args)` (a picklable module-level function returning bytes).
+
+        `on_result` is called in the parent with the result bytes of a
+        successful job (e.g. to fill a cache) before the job is reported
+        done; if it raises, the job fails instead. `on_done` is called once the
+        job has ended in any way, including failure or cancellation while
+        queued (e.g. to remove its input files).
+
+        Raises:
+            JobQueueFull: If `max_queued` jobs are already waiting
+        """
+        job = Job(kind, fn, args, media_type, headers, on_result, on_done)
+        with self._lock:
+            self._expire()
+            if len(self._pending) >= self.max_queued and self._running >= self.max_workers:
+                self.rejected += 1
+                raise JobQueueFull(
+                    f"Job queue is full ({len(self._pending)} waiting, {self._running} running). Retry later."
+                )
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+            self._dispatch()
+        return job
+
+    def completed_job(
+        self,
+        kind: str,
+        result: bytes,
+        media_type: str = "application/json",
+        headers: Optional[Dict[str, str]] = None
+    ) -> Job:
+        """Register an already available result (e.g. a cache hit) as a finished job."""
+        job = Job(kind, None, (), media_type, headers)
+        job.status = "done"
+        job.started = job.finished = job.submitted
+        job.run_seconds = 0.0
+        job.result = result
+        with self._lock:
+            self._expire()
+            self._jobs[job.job_id] = job
+            self.completed += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job (None if unknown or expired)."""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued job or forget a finished one.
+
+        Returns the job, or None if unknown. Running jobs cannot be
+        interrupted; they are returned unchanged.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            cancelled = job.status == "queued"
+            if cancelled:
+                self._pending.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+                job.fn, job.args = None, ()
+            if job.status != "running":
+                del self._jobs[job_id]
+        if cancelled:
+            self._run_on_done(job)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": len(self._pending),
+                "maxQueued": self.max_queued,
+                "retained": len(self._jobs),
+                "resultTtlSeconds": self.result_ttl,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _dispatch(self) -> None:
+        """Move queued jobs into the pool while workers are free (lock held)."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        while self._pending and self._running < self.max_workers:
+            job = self._pending.popleft()
+            job.status = "running"
+            job.started = time.time()
+            self._running += 1
+            future = self._pool.submit(_run_job, job.fn, job.args)
+            # Arguments (images, detection JSON) are no longer needed here
+            job.fn, job.args = None, ()
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _finish(self, job: Job, future: Future) -> None:
+        broken = False
+        try:
+            ok, value, run_seconds = future.result()
+        except Exception as e:
+            # Worker process died (or the pool was shut down)
+            ok, value, run_seconds = False, (500, f"Job worker failed: {e!r}"), None
+            broken = isinstance(e, BrokenProcessPool)
+
+        # Store the result before publishing "done": a poller that sees the
+        # status may use the result right away (e.g. by its result id)
+        if ok and job.on_result is not None:
+            try:
+                job.on_result(value)
+            except Exception as e:
+                logger.exception(f"Result callback of job {job.job_id} failed")
+                ok, value = False, (500, f"Storing the job result failed: {e!r}")
+            job.on_result = None
+
+        with self._lock:
+            if broken:
+                # A broken pool rejects every later submit; start a fresh one
+                self._pool = None
+            job.finished = time.time()
+            job.run_seconds = run_seconds if run_seconds is not None else job.finished - job.started
+            if ok:
+                job.status = "done"
+                job.result = value
+                self.completed += 1
+            else:
+                job.status = "failed"
+                job.error_status, job.error = value
+                self.failed += 1
+            self._running -= 1
+            self._dispatch()
+
+        self._run_on_done(job)
+
+    def _run_on_done(self, job: Job) -> None:
+        if job.on_done is None:
+            return
+        try:
+            job.on_done()
+        except Exception:
+            logger.exception(f"Done callback of job {job.job_id} failed")
+        job.on_done = None
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished is not None and job.finished < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
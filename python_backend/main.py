@@ -3,19 +3,42 @@ FastAPI backend for tree detection and 3D model generation
 Simple, focused on getting data flowing end-to-end
 """
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Depends, Query, Header
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import cv2
 import numpy as np
 import logging
 import os
-from datetime import datetime
-from typing import Optional, Dict, Any
+import json
+import hashlib
+import tempfile
+import time
+import zlib
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
-from tree_detector_core import detect_trees_in_image
-from model_generator_core import generate_obj_content, generate_model_metadata
+from tree_detector_core import (
+    detect_trees_in_image, validate_detection_options, DEFAULT_BAND_ROWS, DEFAULT_TILE_OVERLAP
+)
+from model_generator_core import (
+    iter_obj_content, generate_glb_content, generate_model_metadata,
+    extract_trees_from_detection, filter_detection, lod_groups
+)
+from tree_model_registry import registry as tree_models
+from tree_lod import DEFAULT_VERTEX_BUDGET, select_lod
+from model_chunks import iter_cell_archive, partition_trees, select_cell
+from image_session_store import ImageSessionStore
+from image_decode import downscale_image, reduced_decode_flags
+from hsv_lut import hsv_range, hsv_ranges_mask
+from hsv_histogram import HsvHistogramCache
+from result_cache import ResultCache, make_cache_key
+from detection_store import DetectionResultStore
+from detection_format import (
+    DETECTION_MEDIA_TYPES, decode_columnar, encode_columnar, negotiate_format, sniff_format
+)
+from job_queue import JobQueue, JobQueueFull
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +58,33 @@ ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', '*').split(',')
 ALLOWED_ORIGINS = [origin.strip() for origin in ALLOWED_ORIGINS]
 logger.info(f"🔒 CORS allowed origins: {ALLOWED_ORIGINS}")
 
+# Decoded uploads kept in memory so HSV tuning doesn't re-upload the tile
+image_sessions = ImageSessionStore()
+
+# Detection responses keyed by image content hash + parameters
+# (RESULT_CACHE_MB memory tier, optional RESULT_CACHE_DIR disk tier)
+result_cache = ResultCache()
+
+# Detection results kept for /generate-model?result_id=..., so clients need
+# not post the JSON back (DETECTION_STORE_MB memory tier spilling to
+# DETECTION_STORE_DIR, entries expire after DETECTION_STORE_TTL_S unused)
+detection_results = DetectionResultStore()
+
+# 3D HSV histograms keyed by image content hash, for threshold sweeps
+hsv_histograms = HsvHistogramCache()
+
+# Long detections/model builds run here instead of on the event loop
+# (JOB_WORKERS processes, JOB_QUEUE_MAX waiting jobs, JOB_RESULT_TTL_S retention)
+job_queue = JobQueue()
+
+# Streaming detections (stream=true) copy the upload here chunk by chunk
+# instead of holding it in memory; the file is removed once the request
+# (or job) has finished. UPLOAD_SPOOL_DIR defaults to the temp directory
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or tempfile.gettempdir()
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Raw rasters: a uint8 (height, width, 3) BGR array saved with np.save
+NPY_MAGIC = b"\x93NUMPY"
+
 # Create FastAPI app
 app = FastAPI(
     title="Tree Detection API",
@@ -64,6 +114,12 @@ def root():
         "endpoints": {
             "health": "/health",
             "detect": "/detect-trees",
+            "detectionResults": "/detection-results",
+            "jobs": "/jobs",
+            "treeModels": "/tree-models",
+            "sessions": "/image-sessions",
+            "hsvHistogram": "/hsv-histogram",
+            "cacheStats": "/cache/stats",
             "docs": "/docs"
         }
     }
@@ -75,13 +131,299 @@ def health_check():
     return {
         "status": "ok",
         "service": "tree-detection",
-        "message": "Python FastAPI backend is running"
+        "message": "Python FastAPI backend is running",
+        "jobs": {key: value for key, value in job_queue.stats().items() if key in ("running", "queued")}
     }
 
 
-@app.post("/detect-trees")
-async def detect_trees(
-    image: UploadFile = File(..., description="Satellite image file"),
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters and sizes of the server-side caches (for monitoring)"""
+    return {
+        "detectionResults": result_cache.stats(),
+        "detectionStore": detection_results.stats(),
+        "imageSessions": image_sessions.stats(),
+        "hsvHistograms": hsv_histograms.stats()
+    }
+
+
+def encode_json(content: Any) -> bytes:
+    """Serialize a response body exactly like FastAPI's JSONResponse does."""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def decode_image(contents: bytes, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """Decode uploaded image bytes to a BGR array (HTTP 400 if undecodable)."""
+    nparr = np.frombuffer(contents, np.uint8)
+    img = cv2.imdecode(nparr, flags)
+    
+    if img is None:
+        raise undecodable_image()
+    
+    logger.info(f"Image decoded successfully: {img.shape[1]}×{img.shape[0]} pixels")
+    return img
+
+
+def undecodable_image() -> HTTPException:
+    logger.error("Failed to decode image")
+    return HTTPException(
+        status_code=400,
+        detail="Failed to decode image. Please ensure the file is a valid image format (PNG, JPG, etc.)"
+    )
+
+
+async def spool_upload(image: UploadFile) -> Tuple[str, str]:
+    """
+    Copy an upload to a file in UPLOAD_SPOOL_DIR without holding it in memory.
+    
+    Returns:
+        (file path, SHA-256 hex digest of the contents)
+    """
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix="forma-upload-", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await image.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        discard_upload(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def discard_upload(path: Optional[str]) -> None:
+    """Remove a spooled upload (no-op for None or an already removed file)."""
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def read_image_file(path: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Image from a spooled upload (HTTP 400 if unreadable).
+    
+    A .npy raster is memory-mapped read-only, so only the rows being
+    processed are paged in (`flags` does not apply); anything else is
+    decoded by OpenCV straight from the file.
+    """
+    with open(path, "rb") as f:
+        is_npy = f.read(len(NPY_MAGIC)) == NPY_MAGIC
+    if not is_npy:
+        img = cv2.imread(path, flags)
+        if img is None:
+            raise undecodable_image()
+        logger.info(f"Image decoded successfully: {img.shape[1]}×{img.shape[0]} pixels")
+        return img
+    
+    try:
+        img = np.load(path, mmap_mode="r", allow_pickle=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid .npy raster: {e}")
+    if img.dtype != np.uint8 or img.ndim != 3 or img.shape[2] != 3 or not img.flags.c_contiguous:
+        raise HTTPException(
+            status_code=400,
+            detail="A .npy raster must be a C-ordered uint8 BGR array of shape (height, width, 3)"
+        )
+    logger.info(f"Raster memory-mapped: {img.shape[1]}×{img.shape[0]} pixels")
+    return img
+
+
+def parse_hsv_ranges(raw: Optional[str]) -> List[Dict[str, Dict[str, int]]]:
+    """
+    Parse the `additional_hsv_ranges` form field (HTTP 400 if malformed).
+    
+    Expects a JSON list of objects shaped like the main thresholds:
+    [{"hue": {"min": 20, "max": 40}, "saturation": {...}, "value": {...}}, ...]
+    """
+    if not raw:
+        return []
+    try:
+        ranges = json.loads(raw)
+        if not isinstance(ranges, list):
+            raise ValueError("expected a JSON list")
+        for thresholds in ranges:
+            hsv_range(thresholds)
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid additional_hsv_ranges: {e}")
+    return ranges
+
+
+def get_image_session(session_id: str):
+    """Fetch a cached image session (HTTP 404 if unknown or evicted)."""
+    session = image_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Image session '{session_id}' not found or expired. Please upload the image again."
+        )
+    return session
+
+
+@app.post("/image-sessions")
+async def create_image_session(
+    image: UploadFile = File(..., description="Satellite image file")
+):
+    """
+    Upload an image once for repeated thresholding/detection.
+    
+    The decoded BGR image and its HSV conversion are cached server-side
+    (LRU, bounded by IMAGE_SESSION_CACHE_MB). Pass the returned `sessionId`
+    as `session_id` to /detect-trees instead of re-uploading the file.
+    """
+    try:
+        logger.info(f"Creating image session for: {image.filename}")
+        contents = await image.read()
+        # Decoding and the HSV conversion take seconds on large tiles; keep
+        # them off the event loop
+        img = await run_in_threadpool(decode_image, contents)
+        session = await run_in_threadpool(
+            image_sessions.create, img, image.filename, hashlib.sha256(contents).hexdigest()
+        )
+        logger.info(f"Image session {session.session_id} created ({image_sessions.stats()})")
+        return session.describe()
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+@app.get("/image-sessions/{session_id}")
+def get_image_session_info(session_id: str):
+    """Describe a cached image session"""
+    return get_image_session(session_id).describe()
+
+
+@app.delete("/image-sessions/{session_id}")
+def delete_image_session(session_id: str):
+    """Release a cached image session"""
+    if not image_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Image session '{session_id}' not found")
+    return {"deleted": session_id}
+
+
+@app.post("/image-sessions/{session_id}/threshold")
+def threshold_image_session(
+    session_id: str,
+    hue_min: int = Form(..., description="HSV Hue minimum (0-179)"),
+    hue_max: int = Form(..., description="HSV Hue maximum (0-179)"),
+    sat_min: int = Form(..., description="HSV Saturation minimum (0-255)"),
+    sat_max: int = Form(..., description="HSV Saturation maximum (0-255)"),
+    val_min: int = Form(..., description="HSV Value minimum (0-255)"),
+    val_max: int = Form(..., description="HSV Value maximum (0-255)"),
+    additional_hsv_ranges: Optional[str] = Form(None, description="JSON list of extra HSV ranges OR-ed with the main one")
+):
+    """
+    Re-threshold a cached image and return the vegetation mask as PNG.
+    
+    Uses the cached HSV array, so only inRange + PNG encoding run per call.
+    The fraction of selected pixels is returned in the X-Vegetation-Coverage header.
+    """
+    session = get_image_session(session_id)
+    ranges = [((hue_min, sat_min, val_min), (hue_max, sat_max, val_max))]
+    ranges += [hsv_range(thresholds) for thresholds in parse_hsv_ranges(additional_hsv_ranges)]
+    mask = hsv_ranges_mask(session.hsv, ranges)
+    coverage = cv2.countNonZero(mask) / mask.size
+    ok, png = cv2.imencode(".png", mask)
+    if not ok:
+        raise HTTPException(status_code=500, detail="Failed to encode mask")
+    return Response(
+        content=png.tobytes(),
+        media_type="image/png",
+        headers={"X-Vegetation-Coverage": f"{coverage:.6f}"}
+    )
+
+
+@app.post("/hsv-histogram")
+async def create_hsv_histogram(
+    image: Optional[UploadFile] = File(None, description="Satellite image file (omit when using session_id)"),
+    session_id: Optional[str] = Form(None, description="Image session id from /image-sessions (replaces the upload)"),
+    ranges: Optional[str] = Form(None, description="Optional JSON list of candidate ranges to evaluate right away")
+):
+    """
+    Build (or reuse) the 3D HSV histogram of an image for threshold sweeps.
+    
+    Returns a `histogramId` for /hsv-histogram/{histogramId}/coverage, the
+    per-channel histograms for slider backgrounds, and the coverage of any
+    `ranges` passed along. The image is read once; later queries only touch
+    the histogram's prefix sums.
+    """
+    if session_id:
+        session = get_image_session(session_id)
+        content_hash = session.content_hash
+        load_hsv = lambda: session.hsv
+    elif image is not None:
+        contents = await image.read()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        load_hsv = lambda: cv2.cvtColor(decode_image(contents), cv2.COLOR_BGR2HSV)
+    else:
+        raise HTTPException(status_code=400, detail="Provide either an image file or a session_id")
+    
+    candidates = []
+    if ranges:
+        try:
+            candidates = json.loads(ranges)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid ranges: {e}")
+    
+    histogram, cached = await run_in_threadpool(hsv_histograms.get_or_build, content_hash, load_hsv)
+    logger.info(f"HSV histogram {content_hash[:12]} {'reused' if cached else 'built'} ({hsv_histograms.stats()})")
+    return {
+        "histogramId": content_hash,
+        "totalPixels": histogram.total_pixels,
+        "cached": cached,
+        "channels": histogram.channels,
+        "coverage": histogram_coverage(histogram, candidates)
+    }
+
+
+@app.post("/hsv-histogram/{histogram_id}/coverage")
+def hsv_histogram_coverage(histogram_id: str, body: Dict[str, Any] = Body(...)):
+    """
+    Pixel counts and fractions for a batch of candidate HSV ranges.
+    
+    Body: {"ranges": [candidate, ...]} where a candidate is a thresholds
+    object ({"hue": {"min", "max"}, "saturation": ..., "value": ...}) or a
+    list of them counted as their union, matching `additional_hsv_ranges`.
+    Each range costs 8 table lookups, independent of image size.
+    """
+    histogram = hsv_histograms.get(histogram_id)
+    if histogram is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"HSV histogram '{histogram_id}' not found or expired. Please build it again."
+        )
+    return {
+        "histogramId": histogram_id,
+        "totalPixels": histogram.total_pixels,
+        "coverage": histogram_coverage(histogram, body.get("ranges", []))
+    }
+
+
+def histogram_coverage(histogram, candidates: Any) -> List[Dict[str, Any]]:
+    """Evaluate candidate ranges against a histogram (HTTP 400 if malformed)."""
+    if not isinstance(candidates, list):
+        raise HTTPException(status_code=400, detail="ranges must be a JSON list")
+    try:
+        return histogram.coverage(candidates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def detection_request(
+    image: Optional[UploadFile] = File(None, description="Satellite image file (omit when using session_id)"),
     hue_min: int = Form(..., description="HSV Hue minimum (0-179)"),
     hue_max: int = Form(..., description="HSV Hue maximum (0-179)"),
     sat_min: int = Form(..., description="HSV Saturation minimum (0-255)"),
@@ -92,8 +434,272 @@ async def detect_trees(
     max_diameter: float = Form(..., description="Maximum tree diameter in meters"),
     cluster_threshold: float = Form(..., description="Cluster threshold diameter in meters"),
     real_width: float = Form(..., description="Real-world width in meters"),
-    real_height: float = Form(..., description="Real-world height in meters")
-):
+    real_height: float = Form(..., description="Real-world height in meters"),
+    tile_size: Optional[int] = Form(None, ge=1, description="Tiled mode: window core size in pixels (omit for single pass)"),
+    tile_overlap: int = Form(DEFAULT_TILE_OVERLAP, ge=0, description="Tiled mode: overlap between windows in pixels"),
+    tile_workers: Optional[int] = Form(None, ge=1, description="Tiled mode: worker processes (default: CPU count)"),
+    extraction: str = Form("contours", description="Blob extraction stage: 'contours' or 'components'"),
+    population: str = Form("poisson", description="Cluster population mode: 'poisson' or 'canopy'"),
+    seed: Optional[int] = Form(None, description="Seed for reproducible cluster population (random if omitted)"),
+    population_workers: Optional[int] = Form(None, description="Worker processes for cluster population (default: CPU count)"),
+    session_id: Optional[str] = Form(None, description="Image session id from /image-sessions (replaces the upload)"),
+    additional_hsv_ranges: Optional[str] = Form(None, description="JSON list of extra HSV ranges OR-ed with the main one"),
+    threshold_engine: str = Form("hsv", description="Mask computation: 'hsv' (cvtColor + inRange) or 'lut' (BGR lookup table)"),
+    lut_bits: int = Form(8, description="LUT engine: bits per channel (8 = exact, 4-7 = quantized)"),
+    include_polygons: bool = Form(True, description="Include polygonPx/polygonM outlines (false: slim response)"),
+    simplify_tolerance_m: Optional[float] = Form(None, ge=0, description="Simplify outlines (Douglas-Peucker) to this tolerance in meters"),
+    cleanup_kernel: int = Form(0, ge=0, description="Mask cleanup: close + open kernel size in pixels (0 = off, 5 = desktop tool)"),
+    cleanup_iterations: int = Form(1, ge=1, description="Mask cleanup: iterations of each morphology operation"),
+    cleanup_median: int = Form(0, ge=0, description="Mask cleanup: median filter size before morphology (0 = off, odd)"),
+    target_meters_per_pixel: Optional[float] = Form(None, gt=0, description="Decode/downscale the image to this resolution first (omit for full resolution)"),
+    stream: bool = Form(False, description="Streaming mode: spool the upload to disk, threshold in bands into one mask (bounded peak memory)"),
+    band_rows: int = Form(DEFAULT_BAND_ROWS, ge=1, description="Streaming mode: image rows per band"),
+    pyramid: bool = Form(False, description="Coarse-to-fine detection: full resolution only around vegetation found on a sampled grid"),
+    pyramid_factor: Optional[int] = Form(None, ge=1, description="Pyramid mode: grid step in pixels (default: from min_diameter)"),
+    response_format: Optional[str] = Form(None, description="json, npz or binary (columnar arrays); default from Accept, else json"),
+    accept: Optional[str] = Header(None)
+) -> Dict[str, Any]:
+    """
+    Parse the detection form shared by /detect-trees and /jobs/detect-trees.
+    
+    Returns:
+        dict with the image source ("session", upload "contents" or the
+        spooled upload's "image_path"), its "content_hash", the detect_trees_in_image arguments ("args",
+        "options"), the negotiated "response_format"
+        and the result "cache_key" (which is also its result id)
+    """
+    if session_id:
+        logger.info(f"Received detection request for image session: {session_id}")
+    elif image is not None:
+        logger.info(f"Received detection request for image: {image.filename}")
+    else:
+        raise HTTPException(status_code=400, detail="Provide either an image file or a session_id")
+    logger.info(f"HSV range: H({hue_min}-{hue_max}), S({sat_min}-{sat_max}), V({val_min}-{val_max})")
+    logger.info(f"Detection params: diameter({min_diameter}-{max_diameter}m), cluster({cluster_threshold}m)")
+    logger.info(f"Real dimensions: {real_width}m × {real_height}m")
+    if tile_size:
+        logger.info(f"Tiled mode: {tile_size}px windows, {tile_overlap}px overlap, workers={tile_workers or 'auto'}")
+    
+    # Validate everything before the cache lookup, so a request gets the
+    # same answer whether or not its result is cached
+    band_rows = band_rows if stream else None
+    try:
+        response_format = negotiate_format(response_format, accept)
+        validate_detection_options(
+            tile_size=tile_size, tile_overlap=tile_overlap, max_workers=tile_workers,
+            extraction=extraction, population=population, threshold_engine=threshold_engine, lut_bits=lut_bits,
+            cleanup_kernel=cleanup_kernel, cleanup_iterations=cleanup_iterations, cleanup_median=cleanup_median,
+            pyramid=pyramid, pyramid_factor=pyramid_factor, band_rows=band_rows
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    extra_ranges = parse_hsv_ranges(additional_hsv_ranges)
+    
+    # Read image bytes (or session); decoding waits until a cache miss.
+    # Streaming requests leave the bytes in a spool file instead
+    session, contents, image_path = None, None, None
+    if session_id:
+        session = get_image_session(session_id)
+        content_hash = session.content_hash
+    elif stream:
+        image_path, content_hash = await spool_upload(image)
+    else:
+        contents = await image.read()
+        if contents[:len(NPY_MAGIC)] == NPY_MAGIC:
+            raise HTTPException(status_code=400, detail="Raw .npy rasters are only accepted with stream=true")
+        content_hash = hashlib.sha256(contents).hexdigest()
+    
+    # Prepare parameters for detection function
+    hsv_thresholds = {
+        "hue": {"min": hue_min, "max": hue_max},
+        "saturation": {"min": sat_min, "max": sat_max},
+        "value": {"min": val_min, "max": val_max}
+    }
+    
+    detection_params = {
+        "min_diameter": min_diameter,
+        "max_diameter": max_diameter,
+        "cluster_threshold": cluster_threshold
+    }
+    
+    real_dimensions = {
+        "width": real_width,
+        "height": real_height
+    }
+    
+    # Execution knobs (tiling, worker counts, threshold engine, streaming)
+    # don't change the detected trees, but the metadata reports them, so
+    # they key the cache too: a hit always describes the request it answers
+    execution = {
+        "tileSize": tile_size or None,
+        "tileOverlap": tile_overlap if tile_size else None,
+        "tileWorkers": tile_workers if tile_size else None,
+        "thresholdEngine": threshold_engine,
+        "populationWorkers": population_workers,
+        "bandRows": band_rows
+    }
+    cache_key = make_cache_key(content_hash, {
+        "hsvThresholds": hsv_thresholds,
+        "additionalHsvRanges": extra_ranges,
+        "lutBits": lut_bits if threshold_engine == "lut" else None,
+        "detectionParams": detection_params,
+        "realDimensions": real_dimensions,
+        "extraction": extraction,
+        "population": population,
+        "seed": seed,
+        "includePolygons": None if include_polygons else False,
+        "simplifyToleranceM": (simplify_tolerance_m or None) if include_polygons else None,
+        "maskCleanup": [cleanup_kernel, cleanup_iterations, cleanup_median] if cleanup_kernel or cleanup_median else None,
+        "pyramidFactor": (pyramid_factor or "auto") if pyramid else None,
+        "targetMetersPerPixel": target_meters_per_pixel,
+        # Uploads get a reduced (DCT-scaled) decode, sessions downscale
+        # their full decode: different pixels for the same content hash
+        "decodeSource": ("session" if session else "upload") if target_meters_per_pixel else None,
+        "responseFormat": None if response_format == "json" else response_format,
+        "execution": execution
+    })
+    
+    return {
+        "session": session,
+        "contents": contents,
+        "content_hash": content_hash,
+        "args": (hsv_thresholds, detection_params, real_dimensions),
+        "options": {
+            "tile_size": tile_size,
+            "tile_overlap": tile_overlap,
+            "max_workers": tile_workers,
+            "extraction": extraction,
+            "population": population,
+            "seed": seed,
+            "population_workers": population_workers,
+            "additional_hsv_ranges": extra_ranges,
+            "threshold_engine": threshold_engine,
+            "lut_bits": lut_bits,
+            "simplify_tolerance_m": simplify_tolerance_m,
+            "include_polygons": include_polygons,
+            "cleanup_kernel": cleanup_kernel,
+            "cleanup_iterations": cleanup_iterations,
+            "cleanup_median": cleanup_median,
+            "pyramid": pyramid,
+            "pyramid_factor": pyramid_factor,
+            "band_rows": band_rows
+        },
+        "target_meters_per_pixel": target_meters_per_pixel,
+        "image_path": image_path,
+        "response_format": response_format,
+        "cache_key": cache_key
+    }
+
+
+def run_detection(
+    contents: Optional[bytes],
+    img: Optional[np.ndarray],
+    hsv: Optional[np.ndarray],
+    args: Tuple[Dict[str, Any], ...],
+    options: Dict[str, Any],
+    result_id: Optional[str] = None,
+    response_format: str = "json",
+    target_meters_per_pixel: Optional[float] = None,
+    image_path: Optional[str] = None
+) -> bytes:
+    """
+    Decode (unless `img` is given), detect and serialize one request.
+    
+    Module-level so background jobs can run it in a worker process.
+    The response starts with its `resultId` (for /generate-model); "npz"
+    and "binary" formats hold the trees as flat typed arrays (see
+    detection_format). With `target_meters_per_pixel` the image is
+    detected at that resolution (see scale_detection_image). Streaming
+    requests pass the spooled upload as `image_path` instead of `contents`.
+    """
+    decoding = None
+    if target_meters_per_pixel:
+        img, decoding = scale_detection_image(contents, img, args[2], target_meters_per_pixel, image_path)
+        # The session's HSV copy is full size
+        hsv = hsv if decoding["sourceDimensionsPx"] == decoding["dimensionsPx"] else None
+    elif image_path is not None:
+        img = read_image_file(image_path)
+    elif img is None:
+        img = decode_image(contents)
+    
+    # Call core detection function
+    logger.info("Starting tree detection...")
+    result = detect_trees_in_image(img, *args, hsv=hsv, **options)
+    # Don't hold the image while serializing
+    img = hsv = None
+    if decoding is not None:
+        result["metadata"]["decoding"] = decoding
+    
+    logger.info(f"Detection complete: {result['summary']['individualTreesCount']} individual trees, "
+               f"{result['summary']['treeClustersCount']} clusters, "
+               f"{result['summary']['totalPopulatedTrees']} populated trees")
+    if result_id is not None:
+        result = {"resultId": result_id, **result}
+    if response_format != "json":
+        return encode_columnar(result, response_format)
+    return encode_json(result)
+
+
+
+def scale_detection_image(
+    contents: Optional[bytes],
+    img: Optional[np.ndarray],
+    real_dimensions: Dict[str, float],
+    target_meters_per_pixel: float,
+    image_path: Optional[str] = None
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Detection image no finer than `target_meters_per_pixel`.
+    
+    Upload bytes (or a spooled upload at `image_path`) are decoded with the
+    largest IMREAD_REDUCED_COLOR_{2,4,8} mode that keeps the target
+    resolution; what is left (or a session's full-size image, or a .npy
+    raster) is area-downscaled. The image never gets upscaled,
+    so metadata.metersPerPixel can stay finer than the target.
+    
+    Returns:
+        (BGR image, metadata.decoding)
+    """
+    start = time.perf_counter()
+    reduction = 1
+    if image_path is not None:
+        # Image headers sit at the start of the file
+        with open(image_path, "rb") as f:
+            header = f.read(UPLOAD_CHUNK_BYTES)
+        reduction, flags = reduced_decode_flags(header, real_dimensions, target_meters_per_pixel)
+        img = read_image_file(image_path, flags)
+    elif img is None:
+        reduction, flags = reduced_decode_flags(contents, real_dimensions, target_meters_per_pixel)
+        img = decode_image(contents, flags)
+    source_height, source_width = img.shape[:2]
+    scaled = downscale_image(img, real_dimensions, target_meters_per_pixel)
+    height, width = scaled.shape[:2]
+    logger.info(f"Detection image scaled to {width}×{height} pixels (decoder reduction {reduction})")
+    return scaled, {
+        "targetMetersPerPixel": target_meters_per_pixel,
+        "reducedDecode": reduction,
+        # Size as decoded (before any area downscale)
+        "sourceDimensionsPx": {"width": source_width, "height": source_height},
+        "dimensionsPx": {"width": width, "height": height},
+        "seconds": round(time.perf_counter() - start, 4)
+    }
+
+
+def detection_inputs(request: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Positional run_detection arguments for a parsed detection request."""
+    session = request["session"]
+    extra = (
+        request["args"], request["options"], request["cache_key"], request["response_format"],
+        request["target_meters_per_pixel"], request["image_path"]
+    )
+    if session is not None:
+        return (None, session.bgr, session.hsv) + extra
+    return (request["contents"], None, None) + extra
+
+
+@app.post("/detect-trees")
+async def detect_trees(request: Dict[str, Any] = Depends(detection_request)):
     """
     Detect trees in a satellite image using HSV color thresholding.
     
@@ -102,151 +708,408 @@ async def detect_trees(
     2. Applies HSV filtering to identify vegetation
     3. Detects individual trees and tree clusters
     4. Returns tree positions and metadata
+    
+    Large tiles can be split into overlapping windows processed on a process
+    pool by passing `tile_size`; the result matches the single-pass output.
+    
+    Pass `session_id` instead of `image` to reuse an image uploaded via
+    /image-sessions: upload, decoding and HSV conversion are skipped.
+    
+    `additional_hsv_ranges` selects several colour ranges at once (e.g. light
+    and dark foliage). `threshold_engine=lut` thresholds the BGR image through
+    a cached lookup table instead of converting it to HSV.
+    
+    Responses are cached by image content hash + parameters; concurrent
+    identical requests share one computation. The X-Cache response header
+    reports HIT, HIT-DISK, COALESCED or MISS.
+    
+    The result is kept server-side under its `resultId` (also sent as
+    X-Result-Id): pass that to /generate-model instead of posting the JSON
+    back. `include_polygons=false` leaves the outlines out of the response;
+    `simplify_tolerance_m` thins them (Douglas-Peucker) before serialization.
+    
+    `cleanup_kernel` (5 matches the desktop tool) closes and opens the mask
+    before blob extraction, optionally after a `cleanup_median` filter, so
+    speckles never reach the per-contour loop; metadata.maskCleanup reports
+    the time taken and the contours left.
+    
+    `pyramid=true` thresholds a sampled grid first and runs the full
+    resolution stages only in the blocks around the vegetation it finds:
+    much faster on sparse (e.g. urban) tiles, with the same trees except
+    blobs too thin for the grid to hit (see metadata.pyramid).
+    
+    `target_meters_per_pixel` detects on an image no finer than that
+    resolution, e.g. half the minimum tree diameter or finer: JPEGs are
+    decoded reduced (IMREAD_REDUCED_COLOR_2/4/8), anything left is
+    area-downscaled. metadata.metersPerPixel reports the effective scale
+    and metadata.decoding the sizes involved.
+    
+    `stream=true` bounds peak memory for very large tiles: the upload is
+    spooled to disk instead of memory, the mask is built in `band_rows`
+    bands with no full-size HSV copy, and the image is released before
+    serialization. The upload may also be a raw .npy raster (uint8 BGR,
+    height × width × 3), which is memory-mapped instead of decoded.
+    metadata.streaming reports the process's peak RSS.
+    
+    `response_format=npz|binary` (or an Accept header naming their media
+    types) returns the trees as flat typed arrays with a JSON header
+    instead: several times smaller and faster to encode and decode.
+    
+    For long runs prefer /jobs/detect-trees, which returns immediately and
+    is polled for the result.
     """
     try:
-        logger.info(f"Received detection request for image: {image.filename}")
-        logger.info(f"HSV range: H({hue_min}-{hue_max}), S({sat_min}-{sat_max}), V({val_min}-{val_max})")
-        logger.info(f"Detection params: diameter({min_diameter}-{max_diameter}m), cluster({cluster_threshold}m)")
-        logger.info(f"Real dimensions: {real_width}m × {real_height}m")
-        
-        # Read image from upload
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            logger.error("Failed to decode image")
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to decode image. Please ensure the file is a valid image format (PNG, JPG, etc.)"
-            )
-        
-        logger.info(f"Image decoded successfully: {img.shape[1]}×{img.shape[0]} pixels")
-        
-        # Prepare parameters for detection function
-        hsv_thresholds = {
-            "hue": {"min": hue_min, "max": hue_max},
-            "saturation": {"min": sat_min, "max": sat_max},
-            "value": {"min": val_min, "max": val_max}
-        }
-        
-        detection_params = {
-            "min_diameter": min_diameter,
-            "max_diameter": max_diameter,
-            "cluster_threshold": cluster_threshold
-        }
-        
-        real_dimensions = {
-            "width": real_width,
-            "height": real_height
-        }
-        
-        # Call core detection function
-        logger.info("Starting tree detection...")
-        result = detect_trees_in_image(
-            img,
-            hsv_thresholds,
-            detection_params,
-            real_dimensions
+        inputs = detection_inputs(request)
+        body, cache_status = await run_in_threadpool(
+            result_cache.get_or_compute, request["cache_key"], lambda: run_detection(*inputs)
         )
+        if cache_status != "MISS":
+            logger.info(f"Detection served from cache ({cache_status})")
+        await run_in_threadpool(detection_results.put, request["cache_key"], body)
         
-        logger.info(f"Detection complete: {result['summary']['individualTreesCount']} individual trees, "
-                   f"{result['summary']['treeClustersCount']} clusters, "
-                   f"{result['summary']['totalPopulatedTrees']} populated trees")
-        
-        return JSONResponse(content=result)
+        return Response(
+            content=body,
+            media_type=DETECTION_MEDIA_TYPES[request["response_format"]],
+            headers={"X-Cache": cache_status, "X-Result-Id": request["cache_key"], "Vary": "Accept"}
+        )
         
     except HTTPException:
         raise
+    except ValueError as e:
+        logger.error(f"Invalid detection parameters: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error during tree detection: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error during tree detection: {str(e)}"
         )
+    finally:
+        discard_upload(request["image_path"])
+
+
+def load_detection_result(result_id: str) -> Dict[str, Any]:
+    """Parse a stored detection result, in any response format (HTTP 404 if unknown or expired)."""
+    body = detection_results.get(result_id)
+    if body is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Detection result '{result_id}' not found or expired. Please run the detection again."
+        )
+    if sniff_format(body) != "json":
+        return decode_columnar(body)
+    return json.loads(body)
+
+
+@app.get("/detection-results/{result_id}")
+def get_detection_result(result_id: str):
+    """A stored detection response, as /detect-trees returned it"""
+    body = detection_results.get(result_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"Detection result '{result_id}' not found or expired")
+    return Response(content=body, media_type=DETECTION_MEDIA_TYPES[sniff_format(body)])
+
+
+@app.delete("/detection-results/{result_id}")
+def delete_detection_result(result_id: str):
+    """Release a stored detection result"""
+    if not detection_results.delete(result_id):
+        raise HTTPException(status_code=404, detail=f"Detection result '{result_id}' not found")
+    return {"deleted": result_id}
+
+
+@app.get("/tree-models")
+def list_tree_models():
+    """Base tree models available for /generate-model (parsed once, reloaded on change)"""
+    return {"models": tree_models.describe()}
+
+
+@app.on_event("startup")
+def preload_tree_models():
+    try:
+        loaded = tree_models.preload()
+        logger.info(f"Loaded {len(loaded)} tree models from {tree_models.model_dir}")
+    except Exception as e:
+        logger.error(f"Failed to preload tree models: {str(e)}")
+
+
+# Tree subsets selectable by /generate-model's tree_types filter
+TREE_TYPES = ("all", "individual", "clusters")
+
+# Export formats of /generate-model: full OBJ text or instanced binary glTF
+MODEL_FORMATS = ("obj", "glb")
+MODEL_MEDIA_TYPES = {"obj": "model/obj", "glb": "model/gltf-binary"}
+
+# OBJ output limit in written vertices: 60k trees of the full Henkel mesh
+# (>600MB files crash most 3D software). Coarser LODs fit more trees
+MAX_OBJ_VERTICES = int(os.environ.get('MODEL_MAX_OBJ_VERTICES', str(60000 * 103)))
+
+
+async def model_input(
+    detection_data: Optional[Dict[str, Any]] = Body(None, description="Detection JSON (omit when using result_id)"),
+    result_id: Optional[str] = Query(None, description="Stored detection result (resultId from /detect-trees) instead of the body"),
+    min_tree_diameter: Optional[float] = Query(None, ge=0, description="Only trees at least this wide (m)"),
+    max_tree_diameter: Optional[float] = Query(None, gt=0, description="Only trees at most this wide (m)"),
+    tree_types: str = Query("all", description="all, individual (detected trees) or clusters (populated trees)")
+) -> Dict[str, Any]:
+    """
+    The detection result a model request works on, after the tree filters.
+    
+    Shared by /generate-model and /jobs/generate-model.
+    """
+    if tree_types not in TREE_TYPES:
+        raise HTTPException(status_code=400, detail=f"tree_types must be one of {', '.join(TREE_TYPES)}")
+    if result_id is not None:
+        detection_data = await run_in_threadpool(load_detection_result, result_id)
+    elif not detection_data:
+        raise HTTPException(status_code=400, detail="Provide the detection JSON as the body or a result_id")
+    return filter_detection(detection_data, min_tree_diameter, max_tree_diameter, tree_types)
+
+
+def model_options(
+    model: Optional[str] = Query(None, description="Base tree model name from /tree-models (default: Henkel_tree)"),
+    format: str = Query("obj", description="obj, or glb for an instanced binary glTF"),
+    instancing: bool = Query(True, description="GLB: EXT_mesh_gpu_instancing (false: one node per tree)"),
+    relative_indices: bool = Query(False, description="OBJ: negative (relative) face indices, identical per tree"),
+    lod: Optional[int] = Query(None, ge=0, description="Level of detail (0 = full mesh); default picks one from the budgets"),
+    vertex_budget: Optional[int] = Query(DEFAULT_VERTEX_BUDGET, gt=0, description="Auto LOD: max vertices over all trees"),
+    max_file_mb: Optional[float] = Query(None, gt=0, description="Auto LOD: max estimated size of one file (OBJ, GLB or archive cell) in MB"),
+    small_tree_diameter: Optional[float] = Query(None, gt=0, description="Trees below this diameter (m) use the next coarser LOD"),
+    cell_size_m: Optional[float] = Query(None, gt=0, description="Split trees into square cells of this size; returns a ZIP of per-cell files"),
+    cell: Optional[str] = Query(None, description="With cell_size_m: generate only this cell (<col>_<row> from the manifest)")
+) -> Dict[str, Any]:
+    """Query options shared by /generate-model and /jobs/generate-model."""
+    return {
+        "model": model,
+        "format": format,
+        "instancing": instancing,
+        "relative_indices": relative_indices,
+        "lod": lod,
+        "vertex_budget": vertex_budget,
+        "max_file_mb": max_file_mb,
+        "small_tree_diameter": small_tree_diameter,
+        "cell_size_m": cell_size_m,
+        "cell": cell
+    }
+
+
+def select_model_cell(detection_data: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Detection data for the request: the whole tile, or only the requested cell.
+    
+    Raises:
+        HTTPException: 400 for a malformed cell, or a cell without cell_size_m
+    """
+    if options["cell"] is None:
+        return detection_data
+    if options["cell_size_m"] is None:
+        raise HTTPException(status_code=400, detail="cell requires cell_size_m")
+    try:
+        return select_cell(detection_data, options["cell_size_m"], options["cell"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def is_cell_archive(options: Dict[str, Any]) -> bool:
+    """Whether the request produces a ZIP of per-cell files."""
+    return options["cell_size_m"] is not None and options["cell"] is None
+
+
+def validate_model_request(detection_data: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check that a detection result can be turned into a model and pick the LOD.
+    
+    Sets options["lod"] when it was left to auto selection.
+    
+    Returns:
+        Model metadata from generate_model_metadata, plus "lod" and the exact
+        "vertexCount"/"faceCount" the file will hold
+    
+    Raises:
+        HTTPException: 400 if there are no trees or too many (OBJ only), or
+            for an unknown format, 404 for an unknown model
+    """
+    model = options["model"]
+    model_format = options["format"]
+    if model_format not in MODEL_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model format '{model_format}' (expected one of {', '.join(MODEL_FORMATS)})"
+        )
+    
+    # Only names from the model directory; never arbitrary paths from clients
+    if model is not None and model.removesuffix(".obj") not in tree_models.names():
+        raise HTTPException(
+            status_code=404,
+            detail=f"Tree model '{model}' not found (available: {', '.join(tree_models.names())})"
+        )
+    
+    if not detection_data.get('individualTrees') and not detection_data.get('treeClusters'):
+        raise HTTPException(
+            status_code=400,
+            detail="No trees found in detection data"
+        )
+    
+    # Generate metadata
+    metadata = generate_model_metadata(detection_data, model)
+    total_trees = metadata['totalTrees']
+    
+    # A cell archive holds one file per cell; the size limits apply per file
+    trees = extract_trees_from_detection(detection_data)
+    file_trees = total_trees
+    if is_cell_archive(options):
+        cells = partition_trees(trees, options["cell_size_m"])
+        metadata["cells"] = len(cells)
+        file_trees = max(len(indices) for indices in cells.values())
+    
+    # Level of detail: explicit, or the finest one within the budgets
+    base_model = tree_models.get(model)
+    if options["lod"] is None:
+        max_bytes = int(options["max_file_mb"] * 1024 * 1024) if options["max_file_mb"] else None
+        options["lod"] = select_lod(
+            base_model, total_trees, options["vertex_budget"], max_bytes, options["relative_indices"],
+            model_format=model_format, instancing=options["instancing"], file_trees=file_trees
+        )
+    groups = lod_groups(trees, base_model, options["lod"], options["small_tree_diameter"])
+    metadata["lod"] = options["lod"]
+    metadata["vertexCount"] = sum(len(group) * mesh.vertex_count for mesh, group in groups)
+    metadata["faceCount"] = sum(len(group) * mesh.face_count for mesh, group in groups)
+    file_vertices = metadata["vertexCount"]
+    if is_cell_archive(options):
+        file_vertices = file_trees * base_model.lod(options["lod"]).vertex_count
+    logger.info(f"Generating {model_format} model: {total_trees} trees at LOD {options['lod']}, "
+               f"{metadata['vertexCount']} vertices, {metadata['faceCount']} faces")
+    
+    # WARNING: Huge OBJ models are impractical (>600MB files that may crash 3D software).
+    # GLB stores each mesh once and ~24 bytes per tree, so it has no such limit
+    if model_format == "obj" and file_vertices > MAX_OBJ_VERTICES:
+        logger.warning(f"WARNING: {total_trees} trees will create a huge file (>600MB) that most 3D software cannot open!")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Model too large: {total_trees:,} trees at LOD {options['lod']} would write "
+                   f"{file_vertices:,} vertices in one file (limit {MAX_OBJ_VERTICES:,}), a file that will crash most 3D software. "
+                   f"Please reduce detection area, use a coarser lod / smaller vertex_budget, cell_size_m, or use format=glb."
+        )
+    return metadata
+
+
+def run_model_generation(detection_data: Dict[str, Any], options: Dict[str, Any]) -> bytes:
+    """OBJ, GLB or cell ZIP bytes for a validated request (module-level for background jobs)."""
+    if is_cell_archive(options):
+        return b"".join(iter_model_archive(detection_data, options))
+    if options["format"] == "glb":
+        return generate_glb_content(
+            detection_data,
+            model_path=options["model"],
+            instancing=options["instancing"],
+            lod=options["lod"],
+            small_tree_diameter=options["small_tree_diameter"]
+        )
+    return b"".join(iter_model_obj(detection_data, options))
+
+
+def iter_model_obj(detection_data: Dict[str, Any], options: Dict[str, Any]) -> Iterator[bytes]:
+    return iter_obj_content(
+        detection_data,
+        model_path=options["model"],
+        relative_indices=options["relative_indices"],
+        lod=options["lod"],
+        small_tree_diameter=options["small_tree_diameter"]
+    )
+
+
+def iter_model_archive(detection_data: Dict[str, Any], options: Dict[str, Any]) -> Iterator[bytes]:
+    return iter_cell_archive(
+        detection_data,
+        options["cell_size_m"],
+        model_format=options["format"],
+        model_path=options["model"],
+        instancing=options["instancing"],
+        relative_indices=options["relative_indices"],
+        lod=options["lod"],
+        small_tree_diameter=options["small_tree_diameter"]
+    )
+
+
+def gzip_chunks(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into a gzip stream chunk by chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
 
 
 @app.post("/generate-model")
-async def generate_model(detection_data: Dict[str, Any] = Body(...)):
+async def generate_model(
+    detection_data: Dict[str, Any] = Depends(model_input),
+    options: Dict[str, Any] = Depends(model_options),
+    gzip: bool = Query(False, description="gzip the OBJ stream (Content-Encoding: gzip)")
+):
     """
-    Generate 3D model (OBJ file) from tree detection results.
+    Generate 3D model (OBJ or GLB file) from tree detection results.
+    
+    GLB stores the base tree mesh once and each tree as a transform, so it
+    is small and not subject to the OBJ size limit. Large OBJ requests get
+    a decimated level of detail automatically (see model_options).
+    
+    The trees come from the posted detection JSON or, with result_id, from
+    a result stored by /detect-trees; both can be narrowed by diameter and
+    tree type (see model_input).
+    
+    With cell_size_m the trees are split into a grid and the response is
+    a streamed ZIP of per-cell files plus manifest.json (cell bounds); add
+    cell=<col>_<row> (and the manifest's lod) to regenerate just one of them.
+    
+    The OBJ is streamed in blocks of trees (chunked transfer), so memory
+    stays flat whatever the tree count. Counts are sent up front in
+    X-Tree-Count / X-Vertex-Count / X-Face-Count headers (and the LOD used
+    in X-Model-Lod); the byte size of the text is only known once written,
+    so there is no Content-Length.
     
     Args:
-        detection_data: Complete tree detection JSON from /detect-trees endpoint
+        detection_data: Tree detection result (posted or stored), filtered
+        options: Model, format and LOD query options
+        gzip: Compress the OBJ stream
     
     Returns:
-        For small models: OBJ file content as plain text
-        For large models: Saves to Downloads folder and returns filepath
+        OBJ file content as a streamed download, the GLB file, or a ZIP of cells
     """
     try:
         logger.info("Received 3D model generation request")
         
-        # Validate detection data
-        if not detection_data.get('individualTrees') and not detection_data.get('treeClusters'):
-            raise HTTPException(
-                status_code=400,
-                detail="No trees found in detection data"
+        # Validation runs before streaming starts, so errors still get a status code
+        detection_data = await run_in_threadpool(select_model_cell, detection_data, options)
+        metadata = await run_in_threadpool(validate_model_request, detection_data, options)
+        headers = {
+            "X-Tree-Count": str(metadata['totalTrees']),
+            "X-Vertex-Count": str(metadata['vertexCount']),
+            "X-Face-Count": str(metadata['faceCount']),
+            "X-Model-Lod": str(metadata['lod'])
+        }
+        
+        if is_cell_archive(options):
+            headers["X-Cell-Count"] = str(metadata['cells'])
+            headers["Content-Disposition"] = f"attachment; filename=trees_model_cells_{options['format']}.zip"
+            return StreamingResponse(
+                iter_model_archive(detection_data, options), media_type="application/zip", headers=headers
             )
         
-        # Generate metadata
-        metadata = generate_model_metadata(detection_data)
-        total_trees = metadata['totalTrees']
-        logger.info(f"Generating model: {total_trees} trees, "
-                   f"{metadata['totalVertices']} vertices, {metadata['totalFaces']} faces")
+        if options["format"] == "glb":
+            glb_content = await run_in_threadpool(run_model_generation, detection_data, options)
+            logger.info(f"GLB generated ({len(glb_content) / 1024:.0f} KB)")
+            headers["Content-Disposition"] = "attachment; filename=trees_model.glb"
+            return Response(content=glb_content, media_type=MODEL_MEDIA_TYPES["glb"], headers=headers)
         
-        # WARNING: Models with >60k trees are impractical (>600MB files that may crash 3D software)
-        if total_trees > 60000:
-            logger.warning(f"WARNING: {total_trees} trees will create a huge file (>600MB) that most 3D software cannot open!")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Model too large: {total_trees} trees would create a {total_trees * 0.01:.0f}MB+ file that will crash most 3D software. "
-                       f"Please reduce detection area or increase cluster threshold to get <60,000 trees. "
-                       f"Current: {total_trees:,} trees. Recommended: <60,000 trees."
-            )
+        chunks = iter_model_obj(detection_data, options)
+        headers["Content-Disposition"] = "attachment; filename=trees_model.obj"
+        if gzip:
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
         
-        # For large models (>20k trees), save to Downloads folder
-        if total_trees > 20000:
-            logger.info(f"Large model detected ({total_trees} trees), saving to Downloads folder...")
-            
-            # Generate OBJ content
-            obj_content, mtl_content = generate_obj_content(detection_data)
-            
-            # Save to Downloads folder (Windows)
-            downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-            os.makedirs(downloads_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            obj_filename = f"trees_model_{total_trees}trees_{timestamp}.obj"
-            obj_filepath = os.path.join(downloads_dir, obj_filename)
-            
-            with open(obj_filepath, 'w') as f:
-                f.write(obj_content)
-            
-            file_size_mb = os.path.getsize(obj_filepath) / (1024 * 1024)
-            logger.info(f"Model saved to {obj_filepath} ({file_size_mb:.2f} MB)")
-            
-            # Return filepath for Express to stream
-            return {
-                "filepath": os.path.abspath(obj_filepath),
-                "filename": obj_filename,
-                "filesize_mb": round(file_size_mb, 2),
-                "total_trees": total_trees,
-                "message": f"Model saved to Downloads folder ({file_size_mb:.1f}MB)"
-            }
-        else:
-            # Small/medium models - return content directly
-            obj_content, mtl_content = generate_obj_content(detection_data)
-            
-            logger.info("Model generation complete")
-            
-            # Return OBJ content with proper headers for download
-            return Response(
-                content=obj_content,
-                media_type="model/obj",
-                headers={
-                    "Content-Disposition": f"attachment; filename=trees_model.obj"
-                }
-            )
+        # A sync iterator is consumed in the threadpool, block by block
+        return StreamingResponse(chunks, media_type=MODEL_MEDIA_TYPES["obj"], headers=headers)
         
     except HTTPException:
         raise
@@ -254,7 +1117,7 @@ async def generate_model(detection_data: Dict[str, Any] = Body(...)):
         logger.error(f"Tree model file not found: {str(e)}")
         raise HTTPException(
             status_code=404,
-            detail=f"Base tree model not found. Please ensure tree_model/Henkel_tree.obj exists."
+            detail=f"Base tree model not found: {str(e)}"
         )
     except Exception as e:
         logger.error(f"Error during model generation: {str(e)}", exc_info=True)
@@ -264,6 +1127,158 @@ async def generate_model(detection_data: Dict[str, Any] = Body(...)):
         )
 
 
+# =============================================================================
+# Background jobs
+# =============================================================================
+# Submit returns a job id right away; the work runs in the job process pool
+# and clients poll /jobs/{id} until the result is ready.
+
+def submit_job(kind: str, fn, args: Tuple[Any, ...], **kwargs) -> Response:
+    """Queue a job (HTTP 429 when the queue is full) and answer 202 with its status."""
+    try:
+        job = job_queue.submit(kind, fn, args, **kwargs)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+    logger.info(f"Queued {kind} job {job.job_id} ({job_queue.stats()})")
+    return job_response(job)
+
+
+def job_response(job) -> Response:
+    info = job.describe()
+    info["statusUrl"] = f"/jobs/{job.job_id}"
+    info["resultUrl"] = f"/jobs/{job.job_id}/result"
+    return Response(
+        content=encode_json(info),
+        status_code=202 if job.status in ("queued", "running") else 200,
+        media_type="application/json",
+        headers={"Location": info["statusUrl"]}
+    )
+
+
+def get_job(job_id: str):
+    """Fetch a job (HTTP 404 if unknown or expired)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job '{job_id}' not found or expired (results are kept {job_queue.result_ttl}s)"
+        )
+    return job
+
+
+@app.post("/jobs/detect-trees", status_code=202)
+async def submit_detection_job(request: Dict[str, Any] = Depends(detection_request)):
+    """
+    Queue a tree detection; takes the same form fields as /detect-trees.
+    
+    Returns 202 with a job id (200 with a finished job on a result cache
+    hit). Poll GET /jobs/{jobId}, then fetch GET /jobs/{jobId}/result.
+    """
+    cache_key = request["cache_key"]
+    media_type = DETECTION_MEDIA_TYPES[request["response_format"]]
+    cached = await run_in_threadpool(result_cache.get, cache_key)
+    if cached is not None:
+        logger.info("Detection job served from cache")
+        discard_upload(request["image_path"])
+        await run_in_threadpool(detection_results.put, cache_key, cached)
+        return job_response(job_queue.completed_job(
+            "detect-trees", cached, media_type=media_type, headers={"X-Cache": "HIT", "X-Result-Id": cache_key}
+        ))
+    
+    def store_result(body: bytes) -> None:
+        result_cache.put(cache_key, body)
+        detection_results.put(cache_key, body)
+    
+    try:
+        return submit_job(
+            "detect-trees",
+            run_detection,
+            detection_inputs(request),
+            media_type=media_type,
+            headers={"X-Cache": "MISS", "X-Result-Id": cache_key},
+            on_result=store_result,
+            on_done=lambda: discard_upload(request["image_path"])
+        )
+    except HTTPException:
+        # Not queued (queue full)
+        discard_upload(request["image_path"])
+        raise
+
+
+@app.post("/jobs/generate-model", status_code=202)
+async def submit_model_job(
+    detection_data: Dict[str, Any] = Depends(model_input),
+    options: Dict[str, Any] = Depends(model_options)
+):
+    """
+    Queue model generation for a detection result (same body and options as /generate-model).
+    
+    The finished job's result is the OBJ or GLB file.
+    """
+    detection_data = await run_in_threadpool(select_model_cell, detection_data, options)
+    metadata = await run_in_threadpool(validate_model_request, detection_data, options)
+    model_format = options["format"]
+    media_type = MODEL_MEDIA_TYPES[model_format]
+    filename = f"trees_model_{metadata['totalTrees']}trees.{model_format}"
+    if is_cell_archive(options):
+        media_type = "application/zip"
+        filename = f"trees_model_{metadata['totalTrees']}trees_cells_{model_format}.zip"
+    return submit_job(
+        "generate-model",
+        run_model_generation,
+        (detection_data, options),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Model-Lod": str(metadata['lod'])
+        }
+    )
+
+
+@app.get("/jobs")
+def job_stats():
+    """Queue depth, worker count and completion counters"""
+    return job_queue.stats()
+
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """Job status with queue/run timing (and the error if it failed)"""
+    return get_job(job_id).describe()
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """
+    The job's response body once done.
+    
+    202 with the status while queued/running; a failed job answers with the
+    status code and message the synchronous endpoint would have returned.
+    """
+    job = get_job(job_id)
+    if job.status == "done":
+        return Response(content=job.result, media_type=job.media_type, headers=job.headers)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    return job_response(job)
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued job or discard a finished one (running jobs run to completion)"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if job.status == "running":
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is already running")
+    return job.describe()
+
+
+@app.on_event("shutdown")
+def shutdown_job_queue():
+    job_queue.shutdown()
+
+
 if __name__ == "__main__":
     logger.info("Starting Tree Detection API...")
     logger.info("Server will be available at: http://localhost:5001")
@@ -0,0 +1,211 @@
+"""
+Spatially chunked model export - split trees into a grid of cells, one OBJ/GLB file per cell
+Cells are streamed as a ZIP archive with a manifest.json index of cell bounds
+"""
+
+import io
+import json
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from model_generator_core import (
+    extract_trees_from_detection, generate_glb_content, generate_mtl_content, iter_obj_content
+)
+
+
+def cell_name(col: int, row: int) -> str:
+    """Cell id used in file names, the manifest and the `cell` query option."""
+    return f"{col}_{row}"
+
+
+def parse_cell_name(name: str) -> Tuple[int, int]:
+    """
+    Inverse of cell_name ("3_5" -> (3, 5)).
+
+    Raises:
+        ValueError: If the name is not "<col>_<row>"
+    """
+    try:
+        col, row = name.split("_")
+        return int(col), int(row)
+    except ValueError:
+        raise ValueError(f"Invalid cell '{name}' (expected <col>_<row>, e.g. 3_5)")
+
+
+def partition_trees(trees: List[Dict[str, Any]], cell_size_m: float) -> Dict[Tuple[int, int], np.ndarray]:
+    """
+    Group trees into square grid cells of the tile.
+
+    Cells are indexed from the tile's bottom-left corner in the detection's
+    meter coordinates (x right, y up - centroidM/positionM are flipped from
+    image rows), so (col, row) = floor(x / size), floor(y / size) and row 0
+    is the tile's bottom (southern) edge.
+
+    Returns:
+        {(col, row): indices into trees}, ordered row by row; empty cells omitted
+    """
+    if cell_size_m <= 0:
+        raise ValueError(f"cell_size_m must be positive, got {cell_size_m}")
+    if not trees:
+        return {}
+    positions = np.array([[tree['x'], tree['y']] for tree in trees], dtype=np.float64)
+    cells = np.floor(positions / cell_size_m).astype(np.int64)
+    order = np.lexsort((cells[:, 0], cells[:, 1]))
+    keys, starts = np.unique(cells[order][:, ::-1], axis=0, return_index=True)
+    bounds = list(starts[1:]) + [len(order)]
+    return {
+        (int(col), int(row)): order[start:stop]
+        for (row, col), start, stop in zip(keys.tolist(), starts.tolist(), bounds)
+    }
+
+
+def cell_detection_data(detection_data: Dict[str, Any], trees: List[Dict[str, Any]], indices: np.ndarray) -> Dict[str, Any]:
+    """
+    A detection result holding only the given trees (all as individual trees),
+    with the tile metadata kept so cells share one origin.
+    """
+    return {
+        'metadata': detection_data.get('metadata', {}),
+        'individualTrees': [
+            {
+                'centroidM': [trees[i]['x'], trees[i]['y']],
+                'estimatedDiameterM': trees[i]['diameter']
+            }
+            for i in indices.tolist()
+        ]
+    }
+
+
+def select_cell(detection_data: Dict[str, Any], cell_size_m: float, cell: str) -> Dict[str, Any]:
+    """
+    Detection data restricted to one cell (e.g. to regenerate it alone).
+
+    Raises:
+        ValueError: If the cell name is malformed
+    """
+    col, row = parse_cell_name(cell)
+    trees = extract_trees_from_detection(detection_data)
+    indices = partition_trees(trees, cell_size_m).get((col, row), np.zeros(0, dtype=np.int64))
+    return cell_detection_data(detection_data, trees, indices)
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink for ZipFile; collected bytes are taken with take()."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def iter_cell_archive(
+    detection_data: Dict[str, Any],
+    cell_size_m: float,
+    model_format: str = "obj",
+    model_path: Optional[str] = None,
+    instancing: bool = True,
+    relative_indices: bool = False,
+    lod: int = 0,
+    small_tree_diameter: Optional[float] = None
+) -> Iterator[bytes]:
+    """
+    Stream a ZIP with one model file per grid cell and a manifest.json.
+
+    Each cell file is generated independently with the same origin (tile
+    center) as a whole-tile export, so the cells line up when loaded
+    together. OBJ cells share trees_model.mtl. The archive is written as it
+    is generated (ZIP data descriptors), one cell in memory at a time.
+
+    Args:
+        detection_data: Tree detection JSON
+        cell_size_m: Cell edge length in meters
+        model_format: "obj" or "glb"
+        model_path, instancing, relative_indices, lod, small_tree_diameter:
+            As for iter_obj_content / generate_glb_content
+
+    Yields:
+        ZIP archive bytes
+    """
+    trees = extract_trees_from_detection(detection_data)
+    cells = partition_trees(trees, cell_size_m)
+
+    real_dims = detection_data.get('metadata', {}).get('realDimensionsM', {})
+    tile_width = real_dims.get('width', 0)
+    tile_height = real_dims.get('height', 0)
+    tile_center_x = tile_width / 2
+    tile_center_z = tile_height / 2
+
+    sink = _ZipStream()
+    manifest_cells = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        if model_format == "obj":
+            archive.writestr("trees_model.mtl", generate_mtl_content())
+
+        for (col, row), indices in cells.items():
+            name = cell_name(col, row)
+            filename = f"cells/trees_{name}.{model_format}"
+            cell_data = cell_detection_data(detection_data, trees, indices)
+
+            with archive.open(filename, 'w', force_zip64=True) as entry:
+                if model_format == "glb":
+                    entry.write(generate_glb_content(
+                        cell_data, model_path=model_path, instancing=instancing,
+                        lod=lod, small_tree_diameter=small_tree_diameter
+                    ))
+                else:
+                    for chunk in iter_obj_content(
+                        cell_data, model_path=model_path, relative_indices=relative_indices,
+                        lod=lod, small_tree_diameter=small_tree_diameter
+                    ):
+                        entry.write(chunk)
+                        yield sink.take()
+
+            # Bounds in tile meters (x right, y up from the bottom-left
+            # corner) and in model space (x right, z = -y, both relative to
+            # the tile center); row 0 is the bottom edge
+            min_x, min_y = col * cell_size_m, row * cell_size_m
+            max_x, max_y = min_x + cell_size_m, min_y + cell_size_m
+            manifest_cells.append({
+                "id": name,
+                "col": col,
+                "row": row,
+                "file": filename,
+                "trees": len(indices),
+                "boundsM": {"minX": min_x, "minY": min_y, "maxX": max_x, "maxY": max_y},
+                "boundsModel": {
+                    "minX": min_x - tile_center_x,
+                    "maxX": max_x - tile_center_x,
+                    "minZ": tile_center_z - max_y,
+                    "maxZ": tile_center_z - min_y
+                }
+            })
+            yield sink.take()
+
+        manifest = {
+            "generated": datetime.now().isoformat(),
+            "format": model_format,
+            "cellSizeM": cell_size_m,
+            "tileWidthM": tile_width,
+            "tileHeightM": tile_height,
+            "origin": "Center of tile",
+            "cellOrigin": "Bottom-left of tile (row 0 is the bottom edge)",
+            "totalTrees": len(trees),
+            "lod": lod,
+            "cells": manifest_cells
+        }
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    yield sink.take()
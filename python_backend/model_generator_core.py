@@ -4,49 +4,34 @@ Extracted from json_to_3d_model.py without GUI dependencies
 """
 
 import os
-from typing import Dict, List, Any, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Any, Tuple, Optional
 from datetime import datetime
 
+import numpy as np
 
-def load_tree_model(model_path: str = "tree_model/Henkel_tree.obj") -> Tuple[List, List, List]:
+from glb_writer import build_instanced_glb
+from obj_writer import format_tree_blocks, relative_face_block
+from tree_model_registry import TreeModel, registry
+
+
+def load_tree_model(model_path: Optional[str] = None) -> Tuple[List, List, List]:
     """
     Load the base tree model from OBJ file.
     
+    Parsed models are cached in the shared registry; the file is only read
+    again when it changes.
+    
     Args:
-        model_path: Path to the base tree OBJ file
+        model_path: Model name in tree_model/ or path to an OBJ file
+            (defaults to the Henkel tree)
     
     Returns:
         Tuple of (vertices, faces, normals)
     """
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Tree model not found: {model_path}")
-    
-    vertices = []
-    faces = []
-    normals = []
-    
-    with open(model_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('v '):
-                # Vertex
-                parts = line.split()
-                vertices.append([float(parts[1]), float(parts[2]), float(parts[3])])
-            elif line.startswith('vn '):
-                # Normal
-                parts = line.split()
-                normals.append([float(parts[1]), float(parts[2]), float(parts[3])])
-            elif line.startswith('f '):
-                # Face
-                parts = line.split()[1:]
-                face = []
-                for part in parts:
-                    # Handle format: v/vt/vn or v//vn or v
-                    indices = part.split('/')
-                    face.append(int(indices[0]))
-                faces.append(face)
-    
-    return vertices, faces, normals
+    model = registry.get(model_path)
+    return model.vertices.tolist(), model.faces_as_lists(), model.normals.tolist()
 
 
 def extract_trees_from_detection(detection_data: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -81,24 +66,123 @@ def extract_trees_from_detection(detection_data: Dict[str, Any]) -> List[Dict[st
     return all_trees
 
 
-def generate_obj_content(
+def filter_detection(
+    detection_data: Dict[str, Any],
+    min_diameter: Optional[float] = None,
+    max_diameter: Optional[float] = None,
+    tree_types: str = "all"
+) -> Dict[str, Any]:
+    """
+    Narrow a detection result to the trees a model should contain.
+
+    Args:
+        detection_data: Tree detection JSON (not modified)
+        min_diameter: Keep trees at least this wide in meters (None: no limit)
+        max_diameter: Keep trees at most this wide in meters (None: no limit)
+        tree_types: "all", "individual" (detected trees only) or "clusters"
+            (populated cluster trees only)
+
+    Returns:
+        The input itself when nothing is filtered, otherwise a shallow copy
+        with filtered tree lists
+    """
+    if min_diameter is None and max_diameter is None and tree_types == "all":
+        return detection_data
+
+    def keep(tree: Dict[str, Any]) -> bool:
+        diameter = tree['estimatedDiameterM']
+        return ((min_diameter is None or diameter >= min_diameter)
+                and (max_diameter is None or diameter <= max_diameter))
+
+    filtered = dict(detection_data)
+    filtered['individualTrees'] = []
+    filtered['treeClusters'] = []
+    if tree_types in ("all", "individual"):
+        filtered['individualTrees'] = [
+            tree for tree in detection_data.get('individualTrees', []) if keep(tree)
+        ]
+    if tree_types in ("all", "clusters"):
+        filtered['treeClusters'] = [
+            {**cluster, 'populatedTrees': [tree for tree in cluster.get('populatedTrees', []) if keep(tree)]}
+            for cluster in detection_data.get('treeClusters', [])
+        ]
+    return filtered
+
+
+# Trees rendered per chunk by iter_obj_content (bounds memory while streaming)
+OBJ_BLOCK_TREES = 1000
+
+# Worker processes rendering OBJ chunks; smaller models are rendered inline
+# (starting the pool costs more than it saves)
+OBJ_WORKERS = int(os.environ.get('MODEL_OBJ_WORKERS', '0')) or os.cpu_count() or 1
+OBJ_PARALLEL_MIN_TREES = 4 * OBJ_BLOCK_TREES
+
+
+def lod_groups(
+    trees: List[Dict[str, Any]],
+    model: TreeModel,
+    lod: int = 0,
+    small_tree_diameter: Optional[float] = None
+) -> List[Tuple[TreeModel, np.ndarray]]:
+    """
+    Split trees by the mesh they are written with.
+    
+    Trees use model.lod(lod); with `small_tree_diameter`, trees below that
+    diameter use the next coarser level.
+    
+    Returns:
+        [(mesh, indices into trees)], without empty groups
+    """
+    mesh = model.lod(lod)
+    indices = np.arange(len(trees))
+    if small_tree_diameter is None or model.lod(lod + 1) is mesh:
+        return [(mesh, indices)]
+    diameters = np.array([tree['diameter'] for tree in trees], dtype=np.float64)
+    small = diameters < small_tree_diameter
+    groups = [(mesh, indices[~small]), (model.lod(lod + 1), indices[small])]
+    return [(group_mesh, group) for group_mesh, group in groups if len(group)]
+
+
+def iter_obj_content(
     detection_data: Dict[str, Any],
     base_tree_height: float = 5.0,
-    model_path: str = "tree_model/Henkel_tree.obj"
-) -> Tuple[str, str]:
+    model_path: Optional[str] = None,
+    block_trees: int = OBJ_BLOCK_TREES,
+    relative_indices: bool = False,
+    lod: int = 0,
+    small_tree_diameter: Optional[float] = None,
+    max_workers: Optional[int] = None
+) -> Iterator[bytes]:
     """
-    Generate OBJ and MTL file contents from detection data.
+    Generate the OBJ file as a sequence of UTF-8 chunks.
+    
+    The header comes first, then one chunk per `block_trees` trees, so
+    memory stays bounded by the block size whatever the tree count.
+    b"".join() of the chunks equals generate_obj_content's OBJ text.
+    
+    Large models render their chunks in a process pool; each chunk knows
+    its first vertex index, and chunks are yielded in file order.
     
     Args:
         detection_data: Tree detection JSON
         base_tree_height: Height of the base tree model in meters
-        model_path: Path to base tree model
+        model_path: Base tree model name (see tree_model_registry) or OBJ path
+        block_trees: Trees per chunk
+        relative_indices: Write faces with negative (relative) indices; the
+            face lines are then the same for every tree, formatted once and
+            copied (and they compress far better)
+        lod: Level of detail of the base model (0 = full mesh, see tree_lod)
+        small_tree_diameter: Trees below this diameter (m) use the next
+            coarser level; they are written after the other trees, keeping
+            their Tree_<n> names
+        max_workers: Worker processes for chunk rendering (default
+            MODEL_OBJ_WORKERS or the CPU count; 1 renders inline)
     
-    Returns:
-        Tuple of (obj_content, mtl_content)
+    Yields:
+        OBJ text chunks
     """
-    # Load base tree model
-    tree_vertices, tree_faces, tree_normals = load_tree_model(model_path)
+    # Base tree model (parsed once, shared between requests)
+    model = registry.get(model_path)
     
     # Extract metadata
     metadata = detection_data.get('metadata', {})
@@ -108,6 +192,7 @@ def generate_obj_content(
     
     # Extract all trees
     trees = extract_trees_from_detection(detection_data)
+    groups = lod_groups(trees, model, lod, small_tree_diameter)
     
     # Calculate tile center for origin offset
     tile_center_x = tile_width / 2
@@ -118,58 +203,124 @@ def generate_obj_content(
     obj_lines.append("# Generated by Forma Tree Detection")
     obj_lines.append(f"# Generated: {datetime.now().isoformat()}")
     obj_lines.append(f"# Trees: {len(trees)}")
+    if any(mesh.level for mesh, _ in groups):
+        for mesh, group in groups:
+            obj_lines.append(f"# Level of detail {mesh.level}: {len(group)} trees, {mesh.vertex_count} vertices each")
     obj_lines.append(f"# Tile size: {tile_width:.2f}m × {tile_height:.2f}m")
     obj_lines.append(f"# Origin: Center of tile ({tile_center_x:.2f}, {tile_center_z:.2f})")
     obj_lines.append("mtllib trees_model.mtl\n")
     
-    vertex_offset = 1  # OBJ indices start at 1
-    
     # === Trees ===
     obj_lines.append("# Trees")
     obj_lines.append("usemtl tree_material\n")
+    yield "\n".join(obj_lines).encode('utf-8')
     
-    for i, tree in enumerate(trees):
-        # Calculate tree height and scale
-        tree_height = tree['diameter'] * 1.5  # Linear relationship
-        scale_factor = tree_height / base_tree_height
-        
-        obj_lines.append(f"# Tree {i+1} (diameter: {tree['diameter']:.1f}m, height: {tree_height:.1f}m)")
-        obj_lines.append(f"o Tree_{i+1}")
-        
-        # Write transformed vertices
-        # Apply 90° rotation around X-axis to make Y the vertical axis
-        # Original model: Z is up (0 to ~1.4m)
-        # After rotation: Y is up
-        # Center the model at tile center for Forma ref point alignment
-        for vertex in tree_vertices:
-            # Scale the base vertex
-            scaled_x = vertex[0] * scale_factor
-            scaled_y = vertex[1] * scale_factor
-            scaled_z = vertex[2] * scale_factor
-            
-            # Rotate 90° around X-axis: (x, y, z) -> (x, z, y)
-            # This makes what was Z (up) become Y (up in Forma)
-            rotated_x = scaled_x
-            rotated_y = scaled_z  # What was Z becomes Y (vertical)
-            rotated_z = scaled_y  # What was Y becomes Z
-            
-            # Translate to tree position, centered at tile center
-            # No Y-flip needed since rotation already handled orientation
-            x = rotated_x + (tree['x'] - tile_center_x)
-            y = rotated_y  # Height above ground (what was Z)
-            z = rotated_z + ( tile_center_z - tree['y'])  # Direct position, no flip
-            
-            obj_lines.append(f"v {x} {y} {z}")
-        
-        # Write faces (adjust indices)
-        for face in tree_faces:
-            face_str = " ".join([str(idx + vertex_offset - 1) for idx in face])
-            obj_lines.append(f"f {face_str}")
+    # Chunk jobs carry their own first_index, so they can render in any order
+    jobs = _obj_block_jobs(
+        trees, groups, block_trees, relative_indices,
+        base_tree_height, tile_center_x, tile_center_z
+    )
+    workers = min(max_workers or OBJ_WORKERS, -(-len(trees) // max(1, block_trees)))
+    if workers <= 1 or len(trees) < OBJ_PARALLEL_MIN_TREES:
+        for job in jobs:
+            yield _render_obj_block(job)
+        return
+    
+    # Keep a few chunks per worker in flight and yield them in file order
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(_render_obj_block, job))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # A closed stream (client gone) drops the chunks not started yet
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _obj_block_jobs(
+    trees: List[Dict[str, Any]],
+    groups: List[Tuple[TreeModel, np.ndarray]],
+    block_trees: int,
+    relative_indices: bool,
+    base_tree_height: float,
+    tile_center_x: float,
+    tile_center_z: float
+) -> Iterator[Dict[str, Any]]:
+    """
+    Split the trees into OBJ chunk jobs for _render_obj_block.
+    
+    Each job holds everything its chunk needs (mesh arrays, tree positions,
+    and the OBJ index of its first vertex), so chunks are independent.
+    """
+    first_index = 1  # OBJ indices start at 1
+    for mesh, group in groups:
+        face_block = None
+        if relative_indices:
+            face_block = relative_face_block(mesh.face_indices, mesh.face_sizes, mesh.vertex_count)
         
-        vertex_offset += len(tree_vertices)
-        obj_lines.append("")
+        for start in range(0, len(group), max(1, block_trees)):
+            numbers = group[start:start + block_trees]
+            block = [trees[i] for i in numbers.tolist()]
+            yield {
+                "numbers": numbers,
+                "diameters": np.array([tree['diameter'] for tree in block], dtype=np.float64),
+                "x": np.array([tree['x'] for tree in block], dtype=np.float64),
+                "y": np.array([tree['y'] for tree in block], dtype=np.float64),
+                "vertices": mesh.vertices,
+                "face_indices": mesh.face_indices,
+                "face_sizes": mesh.face_sizes,
+                "face_block": face_block,
+                "first_index": first_index,
+                "base_tree_height": base_tree_height,
+                "tile_center_x": tile_center_x,
+                "tile_center_z": tile_center_z
+            }
+            first_index += len(block) * mesh.vertex_count
+
+
+def _render_obj_block(job: Dict[str, Any]) -> bytes:
+    """
+    OBJ text of one chunk of trees (module-level so pool workers can run it).
+    
+    Returns:
+        The chunk's lines, starting with a newline and without a trailing one
+    """
+    # Calculate tree height and scale
+    diameters = job["diameters"]
+    tree_heights = diameters * 1.5  # Linear relationship
+    scale_factors = tree_heights / job["base_tree_height"]
+    headers = [
+        f"# Tree {i+1} (diameter: {diameter:.1f}m, height: {height:.1f}m)\no Tree_{i+1}"
+        for i, diameter, height in zip(job["numbers"].tolist(), diameters.tolist(), tree_heights.tolist())
+    ]
+    
+    # Transform all vertices of the block at once: (trees, V, 3)
+    # Apply 90° rotation around X-axis to make Y the vertical axis
+    # Original model: Z is up (0 to ~1.4m), after rotation: Y is up
+    # (x, y, z) -> (x, z, y), so what was Z becomes Y (vertical in Forma)
+    # Then translate to the tree position, centered at tile center
+    # (Y gets no translation, so it is not added to and keeps a -0.0)
+    vertices = job["vertices"][None, :, [0, 2, 1]] * scale_factors[:, None, None]
+    vertices[:, :, 0] += (job["x"] - job["tile_center_x"])[:, None]
+    vertices[:, :, 2] += (job["tile_center_z"] - job["y"])[:, None]
     
-    # Generate MTL content
+    # Vertex/face lines of every tree, face indices offset per tree
+    text = format_tree_blocks(
+        headers, vertices, job["face_indices"], job["face_sizes"],
+        first_index=job["first_index"],
+        face_block=job["face_block"]
+    )
+    # Each tree block ends in an empty line; the line joins put the
+    # separator before each block instead, so the file has no trailing newline
+    return b"\n" + text[:-1]
+
+
+def generate_mtl_content() -> str:
+    """MTL file content matching the OBJ's mtllib/usemtl lines."""
     mtl_lines = []
     mtl_lines.append("# Material file generated by Forma Tree Detection\n")
     
@@ -179,30 +330,111 @@ def generate_obj_content(
     mtl_lines.append("Kd 0.3 0.7 0.3")  # Diffuse color (green)
     mtl_lines.append("Ks 0.1 0.1 0.1")  # Specular color (slight shine)
     
-    obj_content = "\n".join(obj_lines)
-    mtl_content = "\n".join(mtl_lines)
+    return "\n".join(mtl_lines)
+
+
+def generate_obj_content(
+    detection_data: Dict[str, Any],
+    base_tree_height: float = 5.0,
+    model_path: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Generate OBJ and MTL file contents from detection data.
+    
+    Holds the whole OBJ in memory; use iter_obj_content to stream it.
     
-    return obj_content, mtl_content
+    Args:
+        detection_data: Tree detection JSON
+        base_tree_height: Height of the base tree model in meters
+        model_path: Base tree model name (see tree_model_registry) or OBJ path
+    
+    Returns:
+        Tuple of (obj_content, mtl_content)
+    """
+    obj_content = b"".join(iter_obj_content(detection_data, base_tree_height, model_path)).decode('utf-8')
+    return obj_content, generate_mtl_content()
 
 
-def generate_model_metadata(detection_data: Dict[str, Any]) -> Dict[str, Any]:
+def generate_glb_content(
+    detection_data: Dict[str, Any],
+    base_tree_height: float = 5.0,
+    model_path: Optional[str] = None,
+    instancing: bool = True,
+    lod: int = 0,
+    small_tree_diameter: Optional[float] = None
+) -> bytes:
+    """
+    Generate an instanced GLB from detection data.
+    
+    The base mesh is stored once; each tree is a translation and uniform
+    scale (same placement as the OBJ export), so the file grows by about
+    24 bytes per tree instead of a full mesh copy.
+    
+    Args:
+        detection_data: Tree detection JSON
+        base_tree_height: Height of the base tree model in meters
+        model_path: Base tree model name (see tree_model_registry) or OBJ path
+        instancing: EXT_mesh_gpu_instancing (default) or one node per tree
+        lod: Level of detail of the base model (as for iter_obj_content)
+        small_tree_diameter: Trees below this diameter use the next coarser level
+    
+    Returns:
+        GLB file bytes
+    """
+    model = registry.get(model_path)
+    
+    real_dims = detection_data.get('metadata', {}).get('realDimensionsM', {})
+    tile_center_x = real_dims.get('width', 0) / 2
+    tile_center_z = real_dims.get('height', 0) / 2
+    trees = extract_trees_from_detection(detection_data)
+    
+    # Same scale and offsets as iter_obj_content
+    diameters = np.array([tree['diameter'] for tree in trees], dtype=np.float64)
+    scale_factors = diameters * 1.5 / base_tree_height
+    translations = np.zeros((len(trees), 3))
+    translations[:, 0] = np.array([tree['x'] for tree in trees], dtype=np.float64) - tile_center_x
+    translations[:, 2] = tile_center_z - np.array([tree['y'] for tree in trees], dtype=np.float64)
+    
+    groups = []
+    for mesh, group in lod_groups(trees, model, lod, small_tree_diameter):
+        # Z-up model to Y-up: (x, y, z) -> (x, z, y) as in the OBJ. That swap
+        # mirrors the mesh, so the triangle winding is reversed to keep the
+        # faces pointing outward (glTF culls back faces)
+        groups.append({
+            "name": f"{model.name}_lod{mesh.level}" if mesh.level else model.name,
+            "vertices": mesh.vertices[:, [0, 2, 1]],
+            "triangles": mesh.triangles()[:, [0, 2, 1]],
+            "translations": translations[group],
+            "scales": scale_factors[group],
+            "instance_names": [f"Tree_{i + 1}" for i in group.tolist()]
+        })
+    
+    return build_instanced_glb(groups, instancing=instancing)
+
+
+def generate_model_metadata(
+    detection_data: Dict[str, Any],
+    model_path: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Generate metadata about the 3D model.
     
     Args:
         detection_data: Tree detection JSON
+        model_path: Base tree model name or OBJ path (as for generate_obj_content)
     
     Returns:
         Metadata dict with model statistics
     """
     trees = extract_trees_from_detection(detection_data)
     
-    # Load base model to count vertices/faces
+    # Vertex/face counts come from the cached model, no re-parse
     try:
-        tree_vertices, tree_faces, _ = load_tree_model()
-        vertices_per_tree = len(tree_vertices)
-        faces_per_tree = len(tree_faces)
-    except:
+        model = registry.get(model_path)
+        vertices_per_tree = model.vertex_count
+        faces_per_tree = model.face_count
+    except FileNotFoundError:
+        model = None
         vertices_per_tree = 0
         faces_per_tree = 0
     
@@ -219,5 +451,6 @@ def generate_model_metadata(detection_data: Dict[str, Any]) -> Dict[str, Any]:
         "totalFaces": total_faces,
         "tileWidth": real_dims.get('width', 0),
         "tileHeight": real_dims.get('height', 0),
+        "treeModel": model.name if model is not None else None,
         "timestamp": datetime.now().isoformat()
     }
@@ -0,0 +1,351 @@
+"""
+Vectorized OBJ writer - format many tree instances with NumPy instead of per-vertex f-strings
+Floats are written exactly as Python's repr() would, so output is byte-identical
+to the original line-by-line writer
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+_POW10 = np.array([10 ** i for i in range(20)], dtype=np.uint64)
+_POW5 = np.array([5 ** i for i in range(28)], dtype=np.uint64)
+_M32 = np.uint64(0xFFFFFFFF)
+_S32 = np.uint64(32)
+_ONE = np.uint64(1)
+# ASCII for "00".."99" packed little-endian into uint16
+_DIGIT_PAIRS = np.array(
+    [ord(str(i // 10)) | (ord(str(i % 10)) << 8) for i in range(100)], dtype=np.uint16
+)
+# _DIGIT_MASKS[n] keeps the first n of 19 characters
+_DIGIT_MASKS = np.where(np.arange(19)[None, :] < np.arange(20)[:, None], 0xFF, 0).astype(np.uint8)
+
+# Widest repr() of a float64 ('-1.2345678901234567e-05' is 23 chars)
+FLOAT_FIELD = 24
+
+# Values handled by the vectorized path: repr() uses fixed notation from 1e-4
+# up to 1e16; the upper bound is kept lower than that to stay in the verified range
+_FAST_MIN = 1e-4
+_FAST_MAX = 1e15
+
+# Trees formatted per block (keeps the temporary byte matrices small)
+_BLOCK_VERTICES = 8192
+
+
+def _shortest_digits(x: np.ndarray):
+    """
+    Shortest round-tripping decimal of each float (the digits repr() prints).
+
+    Ryu-style: scale the binary value and its rounding interval by a power
+    of ten with exact 128-bit integer arithmetic (in 32-bit limbs), strip as
+    many digits as the interval allows, then round the kept digits to nearest.
+    Only valid for finite values with _FAST_MIN <= |x| < _FAST_MAX.
+
+    Returns:
+        (digits as uint64, number of digits, decimal point position)
+    """
+    ax = np.abs(x)
+    bits = ax.view(np.uint64)
+    mant = bits & np.uint64((1 << 52) - 1)
+    expo = (bits >> np.uint64(52)).astype(np.int64)
+    mv = (mant | np.uint64(1 << 52)) << np.uint64(2)
+    e2 = expo - 1077
+
+    # Scale so the value has 18 integer digits
+    k = 17 - np.floor(np.log10(ax)).astype(np.int64)
+    s = (-(e2 + k)).astype(np.uint64)
+    p5 = _POW5[k]
+
+    # 128-bit mv * 5^k, shifted right by s (the 2^k factor folds into s)
+    a_lo, a_hi = mv & _M32, mv >> _S32
+    b_lo, b_hi = p5 & _M32, p5 >> _S32
+    p0 = a_lo * b_lo
+    p1 = a_lo * b_hi
+    p2 = a_hi * b_lo
+    mid = (p0 >> _S32) + (p1 & _M32) + (p2 & _M32)
+    lo = (p0 & _M32) | (mid << _S32)
+    hi = a_hi * b_hi + (p1 >> _S32) + (p2 >> _S32) + (mid >> _S32)
+    vr = (hi << (np.uint64(64) - s)) | (lo >> s)
+    mask = (_ONE << s) - _ONE
+    rem = lo & mask
+
+    # Rounding interval: (mv + 2) and (mv - 1 or 2) scaled the same way
+    accept = (mant & _ONE) == 0
+    up = rem + (p5 << _ONE)
+    vp = vr + (up >> s)
+    vp_exact = (up & mask) == 0
+    low_mult = np.where((mant == 0) & (expo > 1), np.uint64(1), np.uint64(2))
+    dn = rem.astype(np.int64) - (p5 * low_mult).astype(np.int64)
+    vm = (vr.astype(np.int64) + (dn >> s.astype(np.int64))).astype(np.uint64)
+    vm_exact = (dn & mask.astype(np.int64)) == 0
+
+    lo_int = vm + (~(vm_exact & accept)).astype(np.uint64)
+    hi_int = vp - (vp_exact & ~accept).astype(np.uint64)
+
+    # Digits that can be dropped: the width of the interval gives a first
+    # estimate, short decimals (21.27) allow more and keep iterating
+    span = hi_int - lo_int + _ONE
+    d = np.floor(np.log10(span.astype(np.float64))).astype(np.int64)
+    d += _POW10[d + 1] <= span
+    d -= _POW10[d] > span
+    active = np.arange(len(d))
+    while len(active):
+        p = _POW10[d[active] + 1]
+        ok = (hi_int[active] // p) * p >= lo_int[active]
+        active = active[ok]
+        d[active] += 1
+    p = _POW10[d]
+
+    # Round the kept digits to nearest (ties to even), then clamp into the interval
+    q = vr // p
+    r = vr - q * p
+    half = _ONE << (s - _ONE)
+    hp = p >> _ONE
+    frac_nonzero = rem != 0
+    d0 = d == 0
+    round_up = np.where(d0, rem > half, (r > hp) | ((r == hp) & frac_nonzero))
+    tie = np.where(d0, rem == half, (r == hp) & ~frac_nonzero)
+    round_up |= tie & ((q & _ONE) == _ONE)
+    digits = q + round_up
+    digits = np.minimum(np.maximum(digits, (lo_int + p - _ONE) // p), hi_int // p)
+
+    n = np.searchsorted(_POW10, digits, side='right')
+    return digits, n, n + d - k
+
+
+def format_floats(values: np.ndarray) -> np.ndarray:
+    """
+    Format float64 values as repr() would.
+
+    Returns:
+        (len(values), FLOAT_FIELD) uint8 matrix, one left-aligned ASCII
+        string per row, padded with NUL bytes
+    """
+    x = np.ascontiguousarray(values, dtype=np.float64).ravel()
+    out = np.zeros((len(x), FLOAT_FIELD), dtype=np.uint8)
+    ax = np.abs(x)
+    fast = (ax >= _FAST_MIN) & (ax < _FAST_MAX)
+    if fast.all():
+        return _format_fixed(x)
+    rows = np.nonzero(fast)[0]
+    if len(rows):
+        out[rows] = _format_fixed(x[rows])
+    # Zeros are common (vertices on the ground plane): "0.0" / "-0.0"
+    zero = x == 0
+    out[zero, 0] = np.where(np.signbit(x[zero]), ord('-'), ord('0'))
+    out[zero, 1:4] = np.where(np.signbit(x[zero])[:, None], np.frombuffer(b"0.0", dtype=np.uint8),
+                              np.frombuffer(b".0\0", dtype=np.uint8))
+    # Tiny/huge values (exponent notation), inf and nan
+    for row in np.nonzero(~fast & ~zero)[0]:
+        text = repr(float(x[row])).encode()
+        out[row, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+    return out
+
+
+def _format_fixed(x: np.ndarray) -> np.ndarray:
+    """format_floats for values in the fixed-notation range."""
+    digits, n, decpt = _shortest_digits(x)
+    count = len(x)
+
+    # Left-align to 19 digits and convert two digits at a time
+    c19 = digits * _POW10[19 - n]
+    hi = (c19 // np.uint64(10 ** 10)).astype(np.uint32)
+    lo = c19 - hi.astype(np.uint64) * np.uint64(10 ** 10)
+    pairs = np.empty((count, 10), dtype=np.uint16)
+    for i in range(4, -1, -1):
+        pairs[:, 5 + i] = _DIGIT_PAIRS[lo % np.uint64(100)]
+        lo //= np.uint64(100)
+    for i in range(4, -1, -1):
+        pairs[:, i] = _DIGIT_PAIRS[hi % np.uint32(100)]
+        hi //= np.uint32(100)
+    text = pairs.view(np.uint8)[:, 1:]
+    text &= _DIGIT_MASKS[n]
+
+    # Rows with the same decimal point position share one layout; sorting
+    # makes each group a contiguous slice
+    order = np.argsort(decpt, kind='stable')
+    decpt = decpt[order]
+    text = text[order]
+    negative = np.signbit(x)[order]
+    bounds = np.flatnonzero(np.diff(decpt)) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [count]))
+
+    f = np.zeros((count, FLOAT_FIELD), dtype=np.uint8)
+    f[:, 0] = np.where(negative, ord('-'), 0)
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        point = int(decpt[start])
+        g = text[start:stop]
+        group = f[start:stop]
+        if point <= 0:
+            # 0.000ddd
+            zeros = -point
+            group[:, 1] = ord('0')
+            group[:, 2] = ord('.')
+            group[:, 3:3 + zeros] = ord('0')
+            group[:, 3 + zeros:3 + zeros + 19] = g[:, :FLOAT_FIELD - 3 - zeros]
+        else:
+            # ddd.ddd, with zeros filling integer digits and an empty fraction
+            integer = group[:, 1:1 + point]
+            integer[...] = g[:, :point]
+            integer[integer == 0] = ord('0')
+            group[:, 1 + point] = ord('.')
+            fraction = g[:, point:]
+            group[:, 2 + point:21] = fraction[:, :FLOAT_FIELD - 2 - point]
+            first = group[:, 2 + point]
+            first[first == 0] = ord('0')
+
+    out = np.empty_like(f)
+    out[order] = f
+    return out
+
+
+def format_ints(values: np.ndarray) -> np.ndarray:
+    """
+    Format non-negative integers in decimal.
+
+    Returns:
+        (len(values), width) uint8 matrix, left-aligned and NUL padded
+    """
+    v = np.ascontiguousarray(values, dtype=np.int64).ravel()
+    width = len(str(int(v.max()))) if len(v) else 1
+    right = np.empty((len(v), width), dtype=np.uint8)
+    rest = v.copy()
+    for col in range(width - 1, -1, -1):
+        right[:, col] = rest % 10 + ord('0')
+        rest //= 10
+    # Shift each number to the left edge
+    length = np.searchsorted(_POW10, v.astype(np.uint64), side='right')
+    length = np.maximum(length, 1)
+    cols = np.arange(width)[None, :] + (width - length)[:, None]
+    out = np.take_along_axis(right, np.minimum(cols, width - 1), axis=1)
+    out[cols >= width] = 0
+    return out
+
+
+def _text_rows(lines: Sequence[str]) -> np.ndarray:
+    """Encode strings into a NUL padded uint8 matrix."""
+    encoded = [line.encode('utf-8') for line in lines]
+    width = max(len(line) for line in encoded)
+    return np.array(encoded, dtype=f'S{width}').view(np.uint8).reshape(len(encoded), width)
+
+
+def relative_face_block(face_indices: np.ndarray, face_sizes: np.ndarray, vertex_count: int) -> bytes:
+    """
+    The "f ..." lines of one tree with negative (relative) OBJ indices.
+
+    -1 is the last vertex written, so for a tree whose vertices were just
+    written, vertex i (0-based) is i - vertex_count. The text is the same
+    for every tree and only needs formatting once.
+    """
+    ends = np.cumsum(face_sizes)
+    relative = (face_indices - vertex_count).tolist()
+    lines = [
+        "f " + " ".join(map(str, relative[end - size:end]))
+        for size, end in zip(face_sizes.tolist(), ends.tolist())
+    ]
+    return ("\n".join(lines) + "\n").encode('ascii') if lines else b""
+
+
+def format_tree_blocks(
+    headers: Sequence[str],
+    vertices: np.ndarray,
+    face_indices: np.ndarray,
+    face_sizes: np.ndarray,
+    first_index: int = 1,
+    face_block: Optional[bytes] = None
+) -> bytes:
+    """
+    Write one OBJ block per tree instance.
+
+    Each block is its header lines, one "v x y z" line per vertex, one "f ..."
+    line per face and an empty line, every line ending in "\\n".
+
+    Args:
+        headers: Header text of each tree (may span several lines, no trailing newline)
+        vertices: (trees, V, 3) float64 transformed vertices
+        face_indices: Flat 0-based vertex indices of the base model faces
+        face_sizes: Vertex count of each base model face
+        first_index: OBJ index of the first vertex of the first tree
+        face_block: Pre-formatted face lines used verbatim for every tree
+            (see relative_face_block); absolute indices are written if None
+
+    Returns:
+        UTF-8 encoded OBJ text
+    """
+    trees, per_tree = vertices.shape[0], vertices.shape[1]
+    if not trees:
+        return b""
+
+    # Faces as a (faces, widest) table; -1 marks unused slots of smaller faces
+    face_count = len(face_sizes)
+    widest = int(face_sizes.max()) if face_count else 0
+    face_table = np.full((face_count, widest), -1, dtype=np.int64)
+    face_table[np.arange(widest)[None, :] < face_sizes[:, None]] = face_indices
+    used = face_table >= 0
+
+    vertex_width = 2 + 3 * (FLOAT_FIELD + 1)
+    block_trees = max(1, _BLOCK_VERTICES // max(per_tree, 1))
+    chunks: List[bytes] = []
+    for start in range(0, trees, block_trees):
+        stop = min(trees, start + block_trees)
+        count = stop - start
+
+        # One NUL padded row of text per tree: header, vertices, faces, empty line
+        header_rows = _text_rows([header + "\n" for header in headers[start:stop]])
+        if face_block is None:
+            index_text = format_ints(
+                np.arange(count * per_tree, dtype=np.int64) + first_index + start * per_tree
+            )
+            width = index_text.shape[1]
+            face_width = 2 + widest * (width + 1)
+        else:
+            face_width = 0
+        vertex_start = header_rows.shape[1]
+        face_start = vertex_start + per_tree * vertex_width
+        face_stop = face_start + face_count * face_width
+        block = np.zeros((count, face_stop + 1), dtype=np.uint8)
+        block[:, :vertex_start] = header_rows
+        block[:, face_stop] = ord('\n')
+
+        # "v x y z\n" lines
+        vertex_rows = block[:, vertex_start:face_start].reshape(count, per_tree, vertex_width)
+        numbers = format_floats(vertices[start:stop]).reshape(count, per_tree, 3, FLOAT_FIELD)
+        vertex_rows[:, :, 0] = ord('v')
+        for axis in range(3):
+            col = 1 + axis * (FLOAT_FIELD + 1)
+            vertex_rows[:, :, col] = ord(' ')
+            vertex_rows[:, :, col + 1:col + 1 + FLOAT_FIELD] = numbers[:, :, axis]
+        vertex_rows[:, :, -1] = ord('\n')
+
+        if face_block is not None:
+            # Same face text for every tree: splice the shared bytes in after
+            # each tree's vertices (the block's last column is the empty line,
+            # which goes after the faces)
+            kept = block[:, :face_stop] != 0
+            text = block[:, :face_stop][kept].tobytes()
+            ends = np.cumsum(kept.sum(axis=1)).tolist()
+            tail = face_block + b"\n"
+            begin = 0
+            for end in ends:
+                chunks.append(text[begin:end])
+                chunks.append(tail)
+                begin = end
+            continue
+
+        # "f a b c\n" lines: each vertex index is formatted once, then gathered per face
+        face_rows = block[:, face_start:face_stop].reshape(count, face_count, face_width)
+        face_rows[:, :, 0] = ord('f')
+        tree_base = np.arange(count, dtype=np.int64)[:, None] * per_tree
+        for slot in range(widest):
+            col = 1 + slot * (width + 1)
+            face_rows[:, :, col] = np.where(used[:, slot], ord(' '), 0)
+            text = index_text[tree_base + np.maximum(face_table[:, slot], 0)]
+            text[:, ~used[:, slot]] = 0
+            face_rows[:, :, col + 1:col + 1 + width] = text
+        face_rows[:, :, -1] = ord('\n')
+
+        chunks.append(block[block != 0].tobytes())
+
+    return b"".join(chunks)
@@ -0,0 +1,354 @@
+"""
+Content-addressed cache for detection responses
+In-memory LRU tier, optional on-disk tier, and coalescing of identical in-flight requests
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+
+DEFAULT_MEMORY_MB = int(os.environ.get('RESULT_CACHE_MB', '256'))
+DEFAULT_DISK_DIR = os.environ.get('RESULT_CACHE_DIR') or None
+DEFAULT_DISK_MB = int(os.environ.get('RESULT_CACHE_DISK_MB', '2048'))
+
+# Cached bodies may be JSON, NPZ or the binary detection format
+_FILE_SUFFIX = ".bin"
+
+
+def make_cache_key(content_hash: str, params: Dict[str, Any]) -> str:
+    """
+    Build a cache key from the image content hash and request parameters.
+
+    Args:
+        content_hash: SHA-256 hex digest of the encoded image bytes
+        params: Every parameter that affects the response (JSON-serializable)
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{content_hash}:{canonical}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of serialized responses keyed by make_cache_key.
+
+    Lookups go memory -> disk -> compute. Concurrent callers asking for a key
+    that is already being computed wait for that computation instead of
+    starting their own. All methods are thread-safe.
+
+    With `write_through` every stored value goes to disk as well, so the
+    disk tier survives restarts; otherwise values only reach disk when
+    they are evicted from memory. With `ttl_seconds` an entry unused for
+    that long expires in both tiers. `key_pattern` restricts the keys
+    (and with them the file names) that are accepted.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = DEFAULT_MEMORY_MB * 1024 * 1024,
+        disk_dir: Optional[str] = DEFAULT_DISK_DIR,
+        max_disk_bytes: int = DEFAULT_DISK_MB * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        key_pattern: Optional[Pattern[str]] = None,
+        write_through: bool = True
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.key_pattern = key_pattern
+        self.write_through = write_through
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # key -> file size, ordered least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        # key -> expiry (time.time(), so disk entries survive restarts); TTL only
+        self._expires: Dict[str, float] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes]) -> Tuple[bytes, str]:
+        """
+        Return the cached value for `key`, computing and storing it on a miss.
+
+        Returns:
+            Tuple of (value, status) where status is "HIT", "HIT-DISK",
+            "COALESCED" or "MISS"
+        """
+        self._check_key(key)
+        self._purge_expired()
+        with self._lock:
+            value = self._memory_get(key)
+            if value is not None:
+                return value, "HIT"
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(), "COALESCED"
+
+        try:
+            value = self._disk_get(key)
+            if value is not None:
+                status = "HIT-DISK"
+                self._memory_put(key, value)
+            else:
+                status = "MISS"
+                with self._lock:
+                    self.misses += 1
+                value = compute()
+                self.put(key, value)
+
+            future.set_result(value)
+            return value, status
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached value for `key` (memory, then disk) without computing it; None counts as a miss."""
+        if self.key_pattern is not None and not self.key_pattern.fullmatch(key):
+            return None
+        self._purge_expired()
+        with self._lock:
+            value = self._memory_get(key)
+            if value is not None:
+                return value
+        value = self._disk_get(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._memory_put(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """Store (or refresh) a value computed elsewhere (e.g. by a background job)."""
+        self._check_key(key)
+        self._purge_expired()
+        with self._lock:
+            self._touch(key)
+        if self.write_through:
+            self._disk_put(key, value)
+        self._memory_put(key, value)
+
+    def delete(self, key: str) -> bool:
+        """Drop an entry from both tiers. Returns False if it was not stored."""
+        with self._lock:
+            self._expires.pop(key, None)
+            in_memory = self._memory.pop(key, None)
+            if in_memory is not None:
+                self._memory_bytes -= len(in_memory)
+            on_disk = self._disk.pop(key, None)
+            if on_disk is not None:
+                self._disk_bytes -= on_disk
+        if on_disk is not None:
+            self._remove_file(key)
+        return in_memory is not None or on_disk is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+            stats = {
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hitRate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+                # Entries in memory, on disk or both
+                "entries": len(self._memory.keys() | self._disk.keys()),
+                "memoryEntries": len(self._memory),
+                "memoryMB": round(self._memory_bytes / (1024 * 1024), 2),
+                "maxMemoryMB": round(self.max_memory_bytes / (1024 * 1024), 2),
+                "diskEnabled": bool(self.disk_dir),
+                "diskEntries": len(self._disk),
+                "diskMB": round(self._disk_bytes / (1024 * 1024), 2),
+                "maxDiskMB": round(self.max_disk_bytes / (1024 * 1024), 2) if self.disk_dir else 0
+            }
+            if self.ttl_seconds is not None:
+                stats["ttlSeconds"] = self.ttl_seconds
+            return stats
+
+    def clear(self) -> None:
+        """Drop every cached entry (both tiers); counters are kept."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            disk_keys = list(self._disk)
+            self._disk.clear()
+            self._disk_bytes = 0
+            self._expires.clear()
+        for key in disk_keys:
+            self._remove_file(key)
+
+    # -------------------------------------------------------------------------
+    # Keys and expiry
+    # -------------------------------------------------------------------------
+
+    def _check_key(self, key: str) -> None:
+        if self.key_pattern is not None and not self.key_pattern.fullmatch(key):
+            raise ValueError(f"Invalid cache key '{key}'")
+
+    def _touch(self, key: str) -> None:
+        """Restart the TTL of `key` (lock held)."""
+        if self.ttl_seconds is not None:
+            self._expires[key] = time.time() + self.ttl_seconds
+
+    def _forget_if_absent(self, key: str) -> None:
+        """Drop the expiry of an entry that left both tiers (lock held)."""
+        if key not in self._memory and key not in self._disk:
+            self._expires.pop(key, None)
+
+    def _purge_expired(self) -> None:
+        if self.ttl_seconds is None:
+            return
+        now = time.time()
+        with self._lock:
+            expired = [key for key, expires in self._expires.items() if expires <= now]
+        for key in expired:
+            self.delete(key)
+
+    # -------------------------------------------------------------------------
+    # Memory tier
+    # -------------------------------------------------------------------------
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        """Memory lookup counted as a hit (lock held)."""
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self._touch(key)
+        return value
+
+    def _memory_put(self, key: str, value: bytes) -> None:
+        evicted: List[Tuple[str, bytes]] = []
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            if len(value) > self.max_memory_bytes:
+                # Never flush the whole tier for one oversized value
+                evicted.append((key, value))
+            else:
+                self._memory[key] = value
+                self._memory_bytes += len(value)
+                while self._memory_bytes > self.max_memory_bytes:
+                    evicted.append(self._memory.popitem(last=False))
+                    self._memory_bytes -= len(evicted[-1][1])
+        self._spill(evicted)
+
+    def _spill(self, entries: List[Tuple[str, bytes]]) -> None:
+        """Move values evicted from memory to disk (dropped without a disk tier)."""
+        for key, value in entries:
+            with self._lock:
+                on_disk = key in self._disk
+            if not on_disk:
+                self._disk_put(key, value)
+            with self._lock:
+                self._forget_if_absent(key)
+
+    # -------------------------------------------------------------------------
+    # Disk tier
+    # -------------------------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}{_FILE_SUFFIX}")
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the LRU index from files left by a previous run (mtime = last use)."""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.disk_dir):
+            key = name[:-len(_FILE_SUFFIX)]
+            if not name.endswith(_FILE_SUFFIX):
+                continue
+            if self.key_pattern is not None and not self.key_pattern.fullmatch(key):
+                continue
+            stat = os.stat(os.path.join(self.disk_dir, name))
+            files.append((stat.st_mtime, key, stat.st_size))
+        for mtime, key, size in sorted(files):
+            if self.ttl_seconds is not None:
+                if mtime + self.ttl_seconds <= now:
+                    self._remove_file(key)
+                    continue
+                self._expires[key] = mtime + self.ttl_seconds
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                value = f.read()
+            os.utime(self._path(key))  # Keep mtime order == LRU order across restarts
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+                self._forget_if_absent(key)
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._touch(key)
+        return value
+
+    def _disk_put(self, key: str, value: bytes) -> None:
+        if not self.disk_dir or len(value) > self.max_disk_bytes:
+            return
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(value)
+            self._disk_bytes += len(value)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        evicted = []
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes and self._disk:
+                key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._forget_if_absent(key)
+                evicted.append(key)
+        for key in evicted:
+            self._remove_file(key)
+
+    def _remove_file(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
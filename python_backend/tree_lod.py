@@ -0,0 +1,155 @@
+"""
+Tree model level of detail - vertex-clustering decimation and per-request LOD selection
+Level 0 is the base mesh; each further level keeps roughly half the vertices
+"""
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Target vertex fraction of each level relative to the base mesh
+LOD_RATIOS = (1.0, 0.5, 0.25, 0.12)
+
+# Default per-request budget of written vertices (all trees); auto LOD picks
+# the finest level that fits. ~24k Henkel trees at full detail
+DEFAULT_VERTEX_BUDGET = int(os.environ.get('MODEL_VERTEX_BUDGET', '2500000'))
+
+# Decimated meshes never go below this many vertices (a tetrahedron)
+MIN_VERTICES = 4
+
+# Approximate OBJ bytes of one "v x y z" line (shortest-repr floats)
+OBJ_VERTEX_LINE_BYTES = 55
+
+# Approximate GLB bytes per tree: two float32 VEC3 instance attributes, or
+# one JSON node (name, translation, scale) without instancing
+GLB_INSTANCE_BYTES = 24
+GLB_NODE_BYTES = 160
+# glTF JSON chunk (asset, material, accessors) and chunk headers
+GLB_OVERHEAD_BYTES = 2048
+
+
+def cluster_vertices(vertices: np.ndarray, triangles: np.ndarray, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vertex-clustering decimation: merge all vertices in each grid cell.
+
+    Each cluster is replaced by the mean of its vertices; triangles that
+    collapse (two corners in one cell) or duplicate another are dropped and
+    unreferenced vertices removed.
+
+    Returns:
+        (vertices (n', 3), triangles (t', 3))
+    """
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    _, cluster, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cluster = cluster.reshape(-1)
+    merged = np.zeros((len(counts), 3))
+    np.add.at(merged, cluster, vertices)
+    merged /= counts[:, None]
+
+    tris = cluster[triangles]
+    keep = (tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])
+    tris = tris[keep]
+    # Same corners in any order (either winding) is a duplicate; keep the first
+    _, first = np.unique(np.sort(tris, axis=1), axis=0, return_index=True)
+    tris = tris[np.sort(first)]
+
+    used, remap = np.unique(tris, return_inverse=True)
+    return merged[used], remap.reshape(-1, 3)
+
+
+def decimate(vertices: np.ndarray, triangles: np.ndarray, target_vertices: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster to roughly `target_vertices` vertices (bisection on the cell size).
+
+    Cluster means pull the hull inward (the trunk would float above the
+    ground), so the result is stretched back to the original bounds.
+
+    Returns the input unchanged if it already has no more than the target.
+    """
+    target_vertices = max(MIN_VERTICES, int(target_vertices))
+    if len(vertices) <= target_vertices:
+        return vertices, triangles
+
+    extent = float(np.max(vertices.max(axis=0) - vertices.min(axis=0))) or 1.0
+    # Larger cells merge more: find the smallest cell meeting the target
+    low, high = extent * 1e-4, extent
+    best = cluster_vertices(vertices, triangles, high)
+    for _ in range(24):
+        cell = (low * high) ** 0.5
+        result = cluster_vertices(vertices, triangles, cell)
+        if MIN_VERTICES <= len(result[0]) <= target_vertices:
+            best, high = result, cell
+        elif len(result[0]) > target_vertices:
+            low = cell
+        else:
+            high = cell
+
+    decimated, tris = best
+    low_bound, high_bound = vertices.min(axis=0), vertices.max(axis=0)
+    d_low, d_high = decimated.min(axis=0), decimated.max(axis=0)
+    span = np.where(d_high > d_low, d_high - d_low, 1.0)
+    decimated = low_bound + (decimated - d_low) * ((high_bound - low_bound) / span)
+    return decimated, tris
+
+
+def estimate_obj_bytes(vertex_count: int, face_sizes: np.ndarray, trees: int, relative_indices: bool = False) -> int:
+    """Approximate OBJ size for `trees` copies of a mesh (see iter_obj_content)."""
+    if relative_indices:
+        digits = len(str(vertex_count)) + 1
+    else:
+        digits = len(str(max(vertex_count * trees, 1)))
+    face_bytes = int(np.sum(face_sizes * (digits + 1) + 2))
+    return trees * (60 + vertex_count * OBJ_VERTEX_LINE_BYTES + face_bytes)
+
+
+def estimate_glb_bytes(vertex_count: int, face_sizes: np.ndarray, trees: int, instancing: bool = True) -> int:
+    """Approximate GLB size: the mesh stored once plus each tree's placement (see build_instanced_glb)."""
+    index_bytes = 2 if vertex_count <= 0xFFFF else 4
+    mesh_bytes = vertex_count * 12 + int(np.sum(face_sizes - 2)) * 3 * index_bytes
+    per_tree = GLB_INSTANCE_BYTES if instancing else GLB_NODE_BYTES
+    return GLB_OVERHEAD_BYTES + mesh_bytes + trees * per_tree
+
+
+def select_lod(
+    model,
+    trees: int,
+    vertex_budget: Optional[int] = DEFAULT_VERTEX_BUDGET,
+    max_bytes: Optional[int] = None,
+    relative_indices: bool = False,
+    model_format: str = "obj",
+    instancing: bool = True,
+    file_trees: Optional[int] = None
+) -> int:
+    """
+    Finest LOD level of `model` (a TreeModel) within the budgets.
+
+    Args:
+        model: Base TreeModel (its lod(level) variants are considered)
+        trees: Number of trees to write
+        vertex_budget: Max vertices over all trees (None: no limit)
+        max_bytes: Max estimated size of one output file (None: no limit)
+        relative_indices: Estimate sizes for relative-index OBJ output
+        model_format: "obj" or "glb" (which size estimate max_bytes uses)
+        instancing: Estimate GLB sizes for EXT_mesh_gpu_instancing output
+        file_trees: Trees in the largest output file, e.g. the fullest
+            cell of a cell archive (defaults to `trees`)
+
+    Returns:
+        LOD level; the coarsest one if none fits
+    """
+    file_trees = trees if file_trees is None else file_trees
+    for level in range(model.lod_count):
+        lod = model.lod(level)
+        if vertex_budget is not None and lod.vertex_count * trees > vertex_budget:
+            continue
+        if max_bytes is not None:
+            if model_format == "glb":
+                file_bytes = estimate_glb_bytes(lod.vertex_count, lod.face_sizes, file_trees, instancing)
+            else:
+                file_bytes = estimate_obj_bytes(lod.vertex_count, lod.face_sizes, file_trees, relative_indices)
+            if file_bytes > max_bytes:
+                continue
+        return level
+    return model.lod_count - 1
@@ -0,0 +1,265 @@
+"""
+Tree model registry - parse each base tree OBJ once and share it between requests
+Models are looked up by name, parsed lazily into NumPy arrays and reloaded
+when the file changes on disk
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tree_lod import LOD_RATIOS, decimate
+
+
+# Directory scanned for *.obj base models (defaults to tree_model/ next to this file)
+DEFAULT_MODEL_DIR = os.environ.get(
+    'TREE_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tree_model")
+)
+
+DEFAULT_MODEL_NAME = "Henkel_tree"
+
+
+def triangulate(face_indices: np.ndarray, face_sizes: np.ndarray) -> np.ndarray:
+    """
+    Fan-triangulate polygon faces.
+
+    Args:
+        face_indices: Flat 0-based vertex indices of all faces
+        face_sizes: Vertex count of each face
+
+    Returns:
+        (t, 3) int64 triangle vertex indices
+    """
+    if not len(face_sizes):
+        return np.zeros((0, 3), dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(face_sizes)[:-1]))
+    # Face of size k gives triangles (0, j, j + 1) for j = 1 .. k - 2
+    tri_counts = np.maximum(face_sizes.astype(np.int64) - 2, 0)
+    face_of_tri = np.repeat(np.arange(len(face_sizes)), tri_counts)
+    j = np.arange(len(face_of_tri)) - np.repeat(np.cumsum(tri_counts) - tri_counts, tri_counts) + 1
+    first = starts[face_of_tri]
+    return np.stack([
+        face_indices[first],
+        face_indices[first + j],
+        face_indices[first + j + 1]
+    ], axis=1)
+
+
+class TreeModel:
+    """
+    A parsed base tree model.
+
+    Attributes:
+        vertices: (n, 3) float64 vertex positions as written in the file (Z up)
+        normals: (k, 3) float64 vertex normals
+        face_indices: Flat int64 array of 0-based vertex indices of all faces
+        face_sizes: (m,) int32 number of vertices per face
+        bounds_min / bounds_max: (3,) float64 axis-aligned bounds of the vertices
+        level: LOD level (0 for the parsed file, see lod())
+    """
+
+    def __init__(self, name: str, path: str, mtime_ns: int, size: int):
+        self.name = name
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+        vertices: List[List[float]] = []
+        normals: List[List[float]] = []
+        face_indices: List[int] = []
+        face_sizes: List[int] = []
+
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('v '):
+                    parts = line.split()
+                    vertices.append([float(parts[1]), float(parts[2]), float(parts[3])])
+                elif line.startswith('vn '):
+                    parts = line.split()
+                    normals.append([float(parts[1]), float(parts[2]), float(parts[3])])
+                elif line.startswith('f '):
+                    # Handle format: v/vt/vn or v//vn or v; negative indices are relative
+                    parts = line.split()[1:]
+                    for part in parts:
+                        index = int(part.split('/')[0])
+                        face_indices.append(index - 1 if index > 0 else len(vertices) + index)
+                    face_sizes.append(len(parts))
+
+        self._set_arrays(vertices, normals, face_indices, face_sizes)
+
+    @classmethod
+    def from_arrays(cls, base: "TreeModel", level: int, vertices: np.ndarray, triangles: np.ndarray) -> "TreeModel":
+        """A decimated triangle-mesh variant of `base` (no normals)."""
+        model = cls.__new__(cls)
+        model.name = base.name
+        model.path = base.path
+        model.mtime_ns = base.mtime_ns
+        model.size = base.size
+        model._set_arrays(vertices, [], np.asarray(triangles).reshape(-1), np.full(len(triangles), 3), level)
+        return model
+
+    def _set_arrays(self, vertices, normals, face_indices, face_sizes, level: int = 0) -> None:
+        self.level = level
+        self._lods: Optional[List["TreeModel"]] = None if level == 0 else []
+        self.vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+        self.normals = np.array(normals, dtype=np.float64).reshape(-1, 3)
+        self.face_indices = np.array(face_indices, dtype=np.int64)
+        self.face_sizes = np.array(face_sizes, dtype=np.int32)
+        for array in (self.vertices, self.normals, self.face_indices, self.face_sizes):
+            array.flags.writeable = False
+
+        if len(self.vertices):
+            self.bounds_min = self.vertices.min(axis=0)
+            self.bounds_max = self.vertices.max(axis=0)
+        else:
+            self.bounds_min = self.bounds_max = np.zeros(3)
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.vertices)
+
+    @property
+    def face_count(self) -> int:
+        return len(self.face_sizes)
+
+    def face_array(self) -> Optional[np.ndarray]:
+        """(m, k) 0-based face indices if every face has k vertices, else None."""
+        if not self.face_count or not np.all(self.face_sizes == self.face_sizes[0]):
+            return None
+        return self.face_indices.reshape(self.face_count, int(self.face_sizes[0]))
+
+    def triangles(self) -> np.ndarray:
+        """(t, 3) 0-based triangles (faces fan-triangulated)."""
+        return triangulate(self.face_indices, self.face_sizes)
+
+    def _build_lods(self) -> List["TreeModel"]:
+        """Vertex-clustered variants of the base mesh, one per LOD_RATIOS entry."""
+        lods = [self]
+        triangles = self.triangles()
+        for ratio in LOD_RATIOS[1:]:
+            vertices, tris = decimate(self.vertices, triangles, round(self.vertex_count * ratio))
+            # Stop once the mesh cannot get any coarser
+            if len(vertices) >= lods[-1].vertex_count:
+                break
+            lods.append(TreeModel.from_arrays(self, len(lods), vertices, tris))
+        return lods
+
+    @property
+    def lod_count(self) -> int:
+        """Number of LOD levels (1 for a decimated variant itself)."""
+        return len(self._lod_list())
+
+    def lod(self, level: int) -> "TreeModel":
+        """
+        LOD variant: 0 is this model, higher levels have fewer vertices.
+        Levels past the coarsest return the coarsest.
+        """
+        lods = self._lod_list()
+        return lods[min(max(level, 0), len(lods) - 1)]
+
+    def _lod_list(self) -> List["TreeModel"]:
+        if self.level:
+            return [self]
+        if self._lods is None:
+            # Built on first use; concurrent builds produce identical lists
+            self._lods = self._build_lods()
+        return self._lods
+
+    def faces_as_lists(self) -> List[List[int]]:
+        """1-based face index lists, the shape load_tree_model always returned."""
+        ends = np.cumsum(self.face_sizes)
+        return [
+            chunk.tolist()
+            for chunk in np.split(self.face_indices + 1, ends[:-1])
+        ] if self.face_count else []
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly summary returned to clients."""
+        return {
+            "name": self.name,
+            "file": os.path.basename(self.path),
+            "vertices": self.vertex_count,
+            "faces": self.face_count,
+            "boundsMin": self.bounds_min.tolist(),
+            "boundsMax": self.bounds_max.tolist(),
+            "lods": [
+                {"level": lod.level, "vertices": lod.vertex_count, "faces": lod.face_count}
+                for lod in self._lod_list()
+            ] if self.level == 0 else None
+        }
+
+
+class TreeModelRegistry:
+    """
+    Thread-safe cache of parsed TreeModel objects.
+
+    `get` re-stats the file on every call (cheap) and re-parses it only
+    when its mtime or size changed.
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR):
+        self.model_dir = model_dir
+        self._models: Dict[str, TreeModel] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        """Names of the OBJ models available in the model directory."""
+        if not os.path.isdir(self.model_dir):
+            return []
+        return sorted(
+            name[:-len(".obj")] for name in os.listdir(self.model_dir)
+            if name.lower().endswith(".obj")
+        )
+
+    def resolve(self, name_or_path: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Map a model name ("Henkel_tree", "Henkel_tree.obj") or an OBJ path
+        to (name, absolute path).
+
+        Raises:
+            FileNotFoundError: If no such model exists
+        """
+        name_or_path = name_or_path or DEFAULT_MODEL_NAME
+        if os.sep in name_or_path or "/" in name_or_path:
+            path = name_or_path
+        else:
+            filename = name_or_path if name_or_path.lower().endswith(".obj") else f"{name_or_path}.obj"
+            path = os.path.join(self.model_dir, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(
+                f"Tree model not found: {name_or_path} (available: {', '.join(self.names()) or 'none'})"
+            )
+        path = os.path.abspath(path)
+        return os.path.splitext(os.path.basename(path))[0], path
+
+    def get(self, name_or_path: Optional[str] = None) -> TreeModel:
+        """
+        Return the parsed model, loading or reloading it if needed.
+
+        Raises:
+            FileNotFoundError: If no such model exists
+        """
+        name, path = self.resolve(name_or_path)
+        stat = os.stat(path)
+        with self._lock:
+            model = self._models.get(path)
+            if model is not None and model.mtime_ns == stat.st_mtime_ns and model.size == stat.st_size:
+                return model
+            model = TreeModel(name, path, stat.st_mtime_ns, stat.st_size)
+            self._models[path] = model
+            return model
+
+    def preload(self) -> List[TreeModel]:
+        """Parse every model in the directory (e.g. at startup)."""
+        return [self.get(name) for name in self.names()]
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [self.get(name).describe() for name in self.names()]
+
+
+# Shared per-process registry used by model_generator_core
+registry = TreeModelRegistry()
@@ -163,57 +163,54 @@ export function TreeListPanel({
     try {
       console.log('📦 Requesting 3D model generation...');
       
-      // Call backend with detection data
-      const response = await fetch('api/generate-model', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify(detectionResult)
-      });
+      // Reference the server-side detection result; post the JSON only without one
+      const requestModel = (resultId?: string) => {
+        const query = resultId ? `&result_id=${encodeURIComponent(resultId)}` : '';
+        return fetch(`api/generate-model?gzip=true${query}`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json'
+          },
+          body: JSON.stringify(resultId ? {} : detectionResult)
+        });
+      };
+      let response = await requestModel(detectionResult.resultId);
+      if (response.status === 404 && detectionResult.resultId) {
+        // Stored result expired (or the server restarted): send the JSON instead
+        console.warn('⚠️ Detection result expired on the server, posting it instead');
+        response = await requestModel();
+      }
 
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({ message: 'Unknown error' }));
         throw new Error(errorData.message || `HTTP ${response.status}: ${response.statusText}`);
       }
 
-      // Check if it's a JSON response (large model saved to Downloads) or OBJ content
-      const contentType = response.headers.get('content-type');
-      
-      if (contentType?.includes('application/json')) {
-        // Large model - already saved to Downloads folder
-        const data = await response.json();
-        console.log('✅ Large model saved to Downloads folder:', data);
-        alert(`✅ Large model generated!\n\n` +
-              `📁 Saved to: Downloads/${data.filename}\n` +
-              `📊 Trees: ${data.total_trees?.toLocaleString()}\n` +
-              `💾 Size: ${data.filesize_mb}MB\n\n` +
-              `⚠️ Warning: This is a large file. It may take time to open in 3D software.`);
-      } else {
-        // Normal model - download as blob
-        const objContent = await response.text();
-        console.log('✅ Model generated, size:', objContent.length, 'bytes');
+      // OBJ is streamed (optionally gzip-encoded, which the browser decodes)
+      const blob = await response.blob();
+      console.log('✅ Model generated:', {
+        trees: response.headers.get('x-tree-count'),
+        bytes: blob.size
+      });
 
-        // Create blob and download
-        const blob = new Blob([objContent], { type: 'model/obj' });
-        const url = URL.createObjectURL(blob);
-        const link = document.createElement('a');
-        link.href = url;
-        
-        // Generate filename with timestamp
-        const timestamp = new Date().toISOString().replace(/[:.]/g, '-').slice(0, -5);
-        link.download = `trees_model_${timestamp}.obj`;
-        
-        // Trigger download
-        document.body.appendChild(link);
-        link.click();
-        
-        // Cleanup
-        document.body.removeChild(link);
-        URL.revokeObjectURL(url);
-        
-        console.log('✅ OBJ file downloaded successfully');
-      }
+      // Download the blob
+      const url = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      
+      // Generate filename with timestamp
+      const timestamp = new Date().toISOString().replace(/[:.]/g, '-').slice(0, -5);
+      link.download = `trees_model_${timestamp}.obj`;
+      
+      // Trigger download
+      document.body.appendChild(link);
+      link.click();
+      
+      // Cleanup
+      document.body.removeChild(link);
+      URL.revokeObjectURL(url);
+      
+      console.log('✅ OBJ file downloaded successfully');
       
     } catch (error) {
       console.error('❌ OBJ download failed:', error);
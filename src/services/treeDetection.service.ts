@@ -10,7 +10,8 @@ import type {
   HSVThresholds, 
   DetectionParameters, 
   TreeDetectionResult,
-  ImageDimensions
+  ImageDimensions,
+  DetectionOptions
 } from '../types/treeDetection.types';
 
 // Use relative URL (empty string) - automatically uses /api/* paths
@@ -27,13 +28,15 @@ const API_BASE_URL = '';
  * @param hsvThresholds - HSV color range for tree detection
  * @param detectionParams - Tree size constraints and clustering rules
  * @param realDimensions - Real-world dimensions in meters for coordinate conversion
+ * @param options - Optional server-side stages (outlines on, no mask cleanup by default)
  * @returns Tree detection results with positions, areas, and mask
  */
 export async function detectTrees(
   imageUrl: string,
   hsvThresholds: HSVThresholds,
   detectionParams: DetectionParameters,
-  realDimensions: ImageDimensions
+  realDimensions: ImageDimensions,
+  options: DetectionOptions = {}
 ): Promise<TreeDetectionResult> {
   console.log('🌳 Calling tree detection API...');
   console.log('HSV Thresholds:', hsvThresholds);
@@ -63,6 +66,14 @@ export async function detectTrees(
     formData.append('cluster_threshold', detectionParams.clusterThreshold.toString());
     formData.append('real_width', realDimensions.width.toString());
     formData.append('real_height', realDimensions.height.toString());
+    // Opt-in: slim response without outlines (the JSON export then lacks them)
+    if (options.includePolygons === false) {
+      formData.append('include_polygons', 'false');
+    }
+    // Opt-in: mask cleanup before extraction (5 matches the desktop tool)
+    if (options.cleanupKernel) {
+      formData.append('cleanup_kernel', options.cleanupKernel.toString());
+    }
 
     const response = await fetch('api/detect-trees', {
       method: 'POST',
@@ -23,6 +23,14 @@ export interface DetectionParameters {
   clusterThreshold: number;   // meters - circles > this diameter are clusters
 }
 
+/**
+ * Optional server-side detection stages (omitted = server defaults)
+ */
+export interface DetectionOptions {
+  includePolygons?: boolean;  // false: leave polygonPx/polygonM out of the response
+  cleanupKernel?: number;     // mask cleanup kernel in pixels (0 = off, 5 = desktop tool)
+}
+
 /**
  * Real-world image dimensions for coordinate conversion
  */
@@ -33,10 +41,11 @@ export interface ImageDimensions {
 
 /**
  * Tree polygon contour points in both pixel and meter coordinates
+ * (left out of slim responses, requested with include_polygons=false)
  */
 export interface TreePolygon {
-  polygonPx: number[][];   // [[x, y], [x, y], ...] in pixels
-  polygonM: number[][];    // [[x, y], [x, y], ...] in meters
+  polygonPx?: number[][];   // [[x, y], [x, y], ...] in pixels
+  polygonM?: number[][];    // [[x, y], [x, y], ...] in meters
 }
 
 /**
@@ -74,6 +83,7 @@ export interface TreeCluster extends TreePolygon {
  * Complete tree detection result from Python API
  */
 export interface TreeDetectionResult {
+  resultId?: string;                    // server-side copy, for api/generate-model?result_id=
   metadata: {
     timestamp: string;
     sourceImage: string;